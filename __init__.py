@@ -1,8 +1,8 @@
-"""package for doorjamb"""
-
-__project__ = "Doorjamb"
-__version__ = "0.1"
-
-CLI = "doorjamb"
-VERSION = f"{__project__} v{__version__}"
-DESCRIPTION = "Requirements comparisons for Doorstop"
+"""package for doorjamb"""
+
+__project__ = "Doorjamb"
+__version__ = "0.1"
+
+CLI = "doorjamb"
+VERSION = f"{__project__} v{__version__}"
+DESCRIPTION = "Requirements comparisons for Doorstop"
@@ -0,0 +1,113 @@
+"""
+    Asyncio version of the main pipeline.
+    The branch checks, the merge-base lookup and clearing the temp folder don't depend on each
+    other so they run together.  The diff is then streamed from git through a bounded queue,
+    each item file is processed while git is still writing the rest of the diff.  With more
+    than one cpu the files are processed in worker processes.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import os
+
+from common import logger
+from vcs_common import (_check_active_branch_async, _check_branch_fastforward_async,
+                        _merge_base_async, _stream_branch_diff)
+from process_diff import _temp_path, _prepare_temp_path, _process_patched_file, _build_tree
+from publish_project import publish_project
+
+log = logger(__name__)
+
+# how many parsed files can wait for processing before reading from git pauses
+DIFF_QUEUE_SIZE = 16
+
+
+def _process_file_worker(patched_file, temp_path, after_only=False):
+    """process one changed file, in a worker process when there is more than one cpu
+
+    :return: the document path if the item had a normative change
+    """
+    doc_list = []
+    _process_patched_file(patched_file, temp_path, doc_list, after_only)
+    return doc_list[0] if doc_list else None
+
+
+async def _process_queue(queue, temp_path, executor, after_only=False):
+    """process the patched files from the queue until None is received.
+        The results are collected in diff order so the document list is the same as
+        _process_diff gives.
+
+    :return: the list of changed documents
+    """
+    loop = asyncio.get_running_loop()
+    doc_list = []
+    pending = collections.deque()
+
+    def collect(doc_path):
+        if doc_path and doc_path not in doc_list:
+            doc_list.append(doc_path)
+
+    while True:
+        patched_file = await queue.get()
+        if patched_file is None:
+            break
+        pending.append(loop.run_in_executor(executor, _process_file_worker, patched_file,
+                                            temp_path, after_only))
+        # keep the number of files in flight bounded
+        while len(pending) >= DIFF_QUEUE_SIZE:
+            collect(await pending.popleft())
+    while pending:
+        collect(await pending.popleft())
+    return doc_list
+
+
+def _executor(jobs):
+    """worker processes for the file processing, or a single thread with one cpu"""
+    if jobs > 1:
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    return concurrent.futures.ThreadPoolExecutor(max_workers=1)
+
+
+async def _run(main_branch, project_branch, jobs=1, after_only=False, temp_path=None):
+    """run the git queries and diff processing
+
+    :return: temp path, publish folder and the list of changed documents
+    """
+    temp_path = temp_path or _temp_path(project_branch)
+
+    _, _, base_commit, publish_folder = await asyncio.gather(
+        _check_active_branch_async(project_branch),
+        _check_branch_fastforward_async(main_branch, project_branch),
+        _merge_base_async(main_branch, project_branch),
+        asyncio.to_thread(_prepare_temp_path, temp_path))
+
+    queue = asyncio.Queue(maxsize=DIFF_QUEUE_SIZE)
+    with _executor(jobs) as executor:
+        _, doc_list = await asyncio.gather(
+            _stream_branch_diff(base_commit, project_branch, queue),
+            _process_queue(queue, temp_path, executor, after_only))
+
+    return temp_path, publish_folder, doc_list
+
+
+def run_async(main_branch, project_branch, publish_options=None, jobs=None, after_only=False,
+              temp_path=None):
+    """run the comparison with the git work and diff processing overlapped.
+        The output is the same as the sequential run in main.
+
+    :param main_branch: main branch
+    :param project_branch: project branch
+    :param publish_options: keyword arguments for publish_project
+    :param jobs: number of processes for the diff processing, defaults to the cpu count
+    :param after_only: only publish the project side of the changed items
+    :param temp_path: folder to process the diff in, defaults to one named after the branch
+
+    :return: the publish folder
+    """
+    jobs = jobs or os.cpu_count() or 1
+    temp_path, publish_folder, doc_list = asyncio.run(_run(main_branch, project_branch, jobs,
+                                                           after_only, temp_path))
+
+    tree = _build_tree(temp_path, doc_list)
+    publish_project(tree, project_branch, publish_folder, **(publish_options or {}))
+    return publish_folder
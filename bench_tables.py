@@ -0,0 +1,158 @@
+"""Benchmark the table publishing paths.
+    Compares the markdown table path (_tab_lines_markdown parsed by markdown.markdown) with the
+    direct html emitter (_tab_lines_html_table) on a generated table document.  The rows of
+    the two paths are checked to be the same first, for cells with markdown, html and the
+    characters that need escaping.
+
+    python bench_tables.py --tables 20 --rows 500 --columns 40
+"""
+import argparse
+import re
+import sys
+import timeit
+import doorstop
+import markdown
+
+from doorstop.core.types import Level
+from publish_table import _tab_lines_markdown, _tab_lines_html_table
+
+# cells that have to come out the same on both paths
+CHECK_CELLS = [None, "value", "*range* 1-2", "> plain", "> `src/a.c` (line 3)", "x > y",
+               "a < b & c", "AT&amp;T", "<b>bold</b> > 2",
+               '<span style="color:red"><del>1</del></span>\n<span style="color:blue">2</span>',
+               "# *heading*", "- *list*", "1. *numbered*", "back\\slash", "a_b_c"]
+# a markdown table splits the cell at a pipe and drops the rest, the direct emitter keeps
+# the whole value
+PIPE_CELLS = {"a | b": ("a", "a | b")}
+ROW = re.compile(r"<tr[^>]*>\n(.*?)</tr>", re.S)
+CELL = re.compile(r"<td>(.*?)</td>", re.S)
+
+class _BenchDocument:
+    """stand in for a doorstop document, only what the table publishers use"""
+    def __init__(self, prefix, publish):
+        self.prefix = prefix
+        self.publish = publish
+
+
+class _BenchItem:
+    """stand in for a doorstop item, only what the table publishers use"""
+    def __init__(self, document, uid, level, heading, text, attributes):
+        self.document = document
+        self.uid = uid
+        self.level = Level(level)
+        self.heading = heading
+        self.header = ""
+        self.text = text
+        self.ref = ""
+        self.references = None
+        self.links = []
+        self.parent_items = []
+        self._attributes = attributes
+
+    def attribute(self, attrib):
+        """get an extended attribute"""
+        return self._attributes.get(attrib)
+
+    def find_child_items(self):
+        """no child items in the benchmark"""
+        return []
+
+
+def _bench_items(tables, rows, columns):
+    """generate the items for a table document"""
+    publish = ["attr{}".format(column) for column in range(columns)]
+    document = _BenchDocument("TAB", publish)
+    items = []
+    count = 0
+    for table in range(1, tables + 1):
+        count += 1
+        items.append(_BenchItem(document, "TAB{:05}".format(count), "{}.0".format(table), True,
+                                "Table {}".format(table), {}))
+        for row in range(1, rows + 1):
+            count += 1
+            attributes = {}
+            for column, attr in enumerate(publish):
+                if column % 10 == 0:
+                    value = "*range* {}-{}".format(row, row + column)
+                elif column % 7 == 0:
+                    value = '<span style="color:red"><del>{0}</del></span>\n' \
+                            '<span style="color:blue">{1}</span>\n'.format(row, row + 1)
+                else:
+                    value = "value {}".format(column)
+                attributes[attr] = value
+            attributes["primarykey"] = row == 1
+            items.append(_BenchItem(document, "TAB{:05}".format(count),
+                                    "{}.{}".format(table, row), False,
+                                    "Field {}\nnote for field {}".format(row, row), attributes))
+    return items
+
+
+def _check_items():
+    """a table with a row for each of the check cells, in a column and in the notes"""
+    cells = CHECK_CELLS + list(PIPE_CELLS)
+    document = _BenchDocument("TAB", ["value"])
+    items = [_BenchItem(document, "TAB00001", "1.0", True, "Check", {})]
+    for row, cell in enumerate(cells, start=1):
+        note = "note" if cell is None else cell
+        items.append(_BenchItem(document, "TAB{:05}".format(row + 1), "1.{}".format(row), False,
+                                "Field {}\n{}".format(row, note), {"value": cell}))
+    return cells, items
+
+
+def check():
+    """compare the rows of the two paths
+
+    :return: the cells that don't come out as expected, with both versions of the row
+    """
+    cells, items = _check_items()
+    markdown_rows = ROW.findall(_markdown_path(items))[1:]
+    direct_rows = ROW.findall(_direct_path(items))[1:]
+    failed = []
+    for cell, markdown_row, direct_row in zip(cells, markdown_rows, direct_rows):
+        if cell in PIPE_CELLS:
+            expected = PIPE_CELLS[cell]
+            if (CELL.findall(markdown_row)[1], CELL.findall(direct_row)[1]) != expected:
+                failed.append((cell, markdown_row, direct_row))
+        elif markdown_row != direct_row:
+            failed.append((cell, markdown_row, direct_row))
+    if len(markdown_rows) != len(cells) or len(direct_rows) != len(cells):
+        failed.append(("rows", len(markdown_rows), len(direct_rows)))
+    return failed
+
+
+def _markdown_path(items):
+    """the markdown table path"""
+    text = "\n".join(_tab_lines_markdown(items, linkify=False, to_html=True))
+    return markdown.markdown(text, extensions=doorstop.publisher.EXTENSIONS)
+
+
+def _direct_path(items):
+    """the direct html emitter"""
+    return "\n".join(_tab_lines_html_table(items, linkify=False, to_html=True))
+
+
+def main(args=None):
+    """run the benchmark"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tables", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=200)
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(args=args)
+
+    failed = check()
+    for cell, markdown_row, direct_row in failed:
+        print("{!r} is different\n  markdown: {!r}\n  direct:   {!r}".format(
+            cell, markdown_row, direct_row))
+    if failed:
+        sys.exit(1)
+    print("{} check cells are the same on both paths".format(len(CHECK_CELLS) + len(PIPE_CELLS)))
+    items = _bench_items(args.tables, args.rows, args.columns)
+    print("{} items, {} columns".format(len(items), args.columns))
+    for name, path in (("markdown", _markdown_path), ("direct", _direct_path)):
+        best = min(timeit.repeat(lambda: path(items), number=1, repeat=args.repeat))
+        print("{:10} {:8.3f}s {:10} bytes".format(name, best, len(path(items))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+    Change manifest for the project branch.
+    One JSON record for each changed item is written as the diff is read, with the fields that
+    changed and their values on each side.  Nothing is rendered and no temp tree is built, so
+    tools that only need to know what changed don't have to run the publishers.
+"""
+import json
+import os
+import sys
+import doorstop
+import frontmatter
+import yaml
+
+from common import logger, ITEM_FORMAT_MARKDOWN, ITEM_FORMAT_YAML, NON_NORMATIVE_FIELDS
+from process_diff import _item_format
+
+log = logger(__name__)
+
+CHANGE_ADDED = "added"
+CHANGE_MODIFIED = "modified"
+CHANGE_REMOVED = "removed"
+DOCUMENT_CONFIG = ".doorstop.yml"
+# markdown items keep the text after the front matter
+MARKDOWN_TEXT_FIELD = "text"
+
+# the C loader is much faster when pyyaml was built with libyaml
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+_PREFIXES = {}
+
+
+def _document_prefix(doc_path):
+    """prefix of the document in the folder, the folder name if the config can't be read"""
+    if doc_path not in _PREFIXES:
+        prefix = os.path.basename(doc_path)
+        try:
+            with open(os.path.join(doc_path, DOCUMENT_CONFIG), "r", encoding="utf-8") as stream:
+                config = yaml.safe_load(stream) or {}
+            prefix = config.get("settings", {}).get("prefix", prefix)
+        except (OSError, yaml.YAMLError) as err:
+            log.warning("Could not read the document prefix for %s: %s", doc_path, err)
+        _PREFIXES[doc_path] = prefix
+    return _PREFIXES[doc_path]
+
+
+def _change_kind(patched_file):
+    """added, modified or removed"""
+    if patched_file.is_added_file:
+        return CHANGE_ADDED
+    if patched_file.is_removed_file:
+        return CHANGE_REMOVED
+    return CHANGE_MODIFIED
+
+
+def _field_value(field, lines, item_format):
+    """the value of a field from its lines on one side of the diff, None if it isn't there"""
+    if not lines:
+        return None
+    text = "".join(lines)
+    if item_format == ITEM_FORMAT_MARKDOWN and field == MARKDOWN_TEXT_FIELD:
+        return text
+    try:
+        return (yaml.load(text, Loader=YAML_LOADER) or {}).get(field)
+    except (yaml.YAMLError, AttributeError) as err:
+        log.warning("Could not parse field %s: %s", field, err)
+        return text
+
+
+def _manifest_record(patched_file):
+    """the manifest record for one changed item file.
+        The lines are split by field in a single pass, only the fields that changed are
+        parsed.
+
+    :return: the record, None if the file isn't an item
+    """
+    file_path = patched_file.path
+    file_name = os.path.basename(file_path)
+    if file_name.startswith("."):
+        return None
+    item_format = _item_format(file_path)
+    if item_format is None:
+        _, file_ext = os.path.splitext(file_name)
+        msg = f"'{file_path}' extension for itemformat {file_ext} not valid"
+        raise doorstop.DoorstopError(msg)
+
+    before = {}
+    after = {}
+    changed_fields = []
+    field = ""
+    delimiter_count = 0
+    if item_format == ITEM_FORMAT_MARKDOWN:
+        handler = frontmatter.YAMLHandler()
+
+    for hunk in patched_file:
+        for line in hunk:
+            if item_format == ITEM_FORMAT_MARKDOWN and handler.FM_BOUNDARY.search(line.value):
+                if not line.is_removed or patched_file.is_removed_file:
+                    delimiter_count += 1
+                    if delimiter_count >= 2:
+                        field = MARKDOWN_TEXT_FIELD
+                continue
+
+            if item_format == ITEM_FORMAT_YAML or delimiter_count == 1:
+                if not line.value.startswith((" ", "-")) and line.value.strip():
+                    field = line.value.split(':', 1)[0]
+
+            if not line.is_added:
+                before.setdefault(field, []).append(line.value)
+            if not line.is_removed:
+                after.setdefault(field, []).append(line.value)
+            if (line.is_added or line.is_removed) and field not in changed_fields:
+                changed_fields.append(field)
+
+    doc_path = os.path.dirname(file_path)
+    return {
+        "uid": os.path.splitext(file_name)[0],
+        "prefix": _document_prefix(doc_path),
+        "path": file_path,
+        "change": _change_kind(patched_file),
+        "fields": changed_fields,
+        "before": {name: _field_value(name, before.get(name), item_format)
+                   for name in changed_fields},
+        "after": {name: _field_value(name, after.get(name), item_format)
+                  for name in changed_fields},
+        "normative": any(name not in NON_NORMATIVE_FIELDS for name in changed_fields),
+    }
+
+
+def write_manifest(patch_set, stream=None):
+    """write one JSON line for each changed item in the diff, flushed as each one is ready
+
+    :param patch_set: the parsed branch diff
+    :param stream: text stream to write to, defaults to stdout
+
+    :return: the number of records written
+    """
+    stream = stream or sys.stdout
+    count = 0
+    for patched_file in patch_set:
+        record = _manifest_record(patched_file)
+        if record is None:
+            continue
+        stream.write(json.dumps(record, default=str) + "\n")
+        stream.flush()
+        count += 1
+    log.info("Wrote %d change manifest records", count)
+    return count
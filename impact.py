@@ -0,0 +1,283 @@
+"""
+    Impact analysis for the changed requirements.
+    The items downstream of a changed item, the items that link to it directly or through
+    other items, may need to be looked at again even though the project didn't change them.
+    The parent to child link graph of all the items at the project commit is built once and
+    cached by commit sha as compact adjacency arrays, and the impact of all the changed items
+    is found with one breadth first traversal.  Removed items aren't in that graph, the items
+    that linked to them are found with a traversal of the graph at the merge base.
+"""
+import array
+import collections
+import html
+import json
+import os
+import posixpath
+import frontmatter
+import yaml
+
+from common import logger, ITEM_FORMAT_MARKDOWN
+from process_diff import _item_format
+from vcs_common import _rev_parse, _ls_tree, _read_blobs, _merge_base
+from link_index import DEFAULT_CACHE_DIR, _document_prefixes
+from change_manifest import YAML_LOADER
+
+log = logger(__name__)
+
+GRAPH_VERSION = 1
+IMPACT_FILE = "impact.json"
+IMPACT_COLUMNS = ["Item", "Header", "Document", "Depth", "Through"]
+
+
+def _parse_item(text, item_format):
+    """the header and parent links of an item from the file text"""
+    try:
+        if item_format == ITEM_FORMAT_MARKDOWN:
+            data = frontmatter.loads(text).metadata
+        else:
+            data = yaml.load(text, Loader=YAML_LOADER)
+    except yaml.YAMLError as err:
+        log.warning("Could not parse item for its links: %s", err)
+        return "", []
+    data = data or {}
+    links = []
+    # a link is the UID, or the UID and the fingerprint of the linked item
+    for link in data.get("links") or []:
+        if isinstance(link, dict):
+            links.extend(str(uid) for uid in link)
+        else:
+            links.append(str(link))
+    return str(data.get("header") or "").strip(), links
+
+
+class LinkGraph:
+    """parent to child link graph for all the items at a commit.
+        Item i has the children numbered children[offsets[i]:offsets[i + 1]].  The graph is
+        cached in cache_dir by commit sha so it is only built once per commit.
+
+    :param commit: branch or commit to build the graph for
+    :param cache_dir: folder for the cached graph files
+    :param main_branch: main branch, to find the items that linked to the removed items in
+                        the graph at the merge base
+    """
+    def __init__(self, commit, cache_dir=None, main_branch=None):
+        self.commit = _rev_parse(commit)
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.base_graph = None
+        if main_branch is not None:
+            self.base_graph = LinkGraph(_merge_base(main_branch, self.commit), self.cache_dir)
+        self.uids = []
+        self.headers = []
+        self.prefixes = []
+        self.offsets = array.array("l")
+        self.children = array.array("l")
+        self._numbers = None
+
+    @property
+    def cache_path(self):
+        """file the graph for this commit is cached in"""
+        return os.path.join(self.cache_dir, "link-graph-{}.json".format(self.commit))
+
+    @property
+    def numbers(self):
+        """the number of each item by UID, the graph is loaded or built on first use"""
+        if self._numbers is None:
+            if not self._load():
+                self._build()
+            self._numbers = {uid: number for number, uid in enumerate(self.uids)}
+        return self._numbers
+
+    def _load(self):
+        """read the cached graph for the commit"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return False
+        if data.get("version") != GRAPH_VERSION or data.get("commit") != self.commit:
+            return False
+        self.uids = data["uids"]
+        self.headers = data["headers"]
+        self.prefixes = data["prefixes"]
+        self.offsets = array.array("l", data["offsets"])
+        self.children = array.array("l", data["children"])
+        log.info("Loaded link graph for %s from %s", self.commit, self.cache_path)
+        return True
+
+    def _build(self):
+        """read the links of every item at the commit, and cache the graph"""
+        paths = _ls_tree(self.commit)
+        prefixes = _document_prefixes(self.commit, paths)
+        item_paths = {}
+        for path in paths:
+            doc_path, file_name = posixpath.split(path)
+            if doc_path not in prefixes or file_name.startswith("."):
+                continue
+            if _item_format(file_name) is None:
+                continue
+            item_paths[posixpath.splitext(file_name)[0]] = path
+
+        self.uids = sorted(item_paths)
+        numbers = {uid: number for number, uid in enumerate(self.uids)}
+        blobs = _read_blobs(self.commit, [item_paths[uid] for uid in self.uids])
+        self.headers = []
+        self.prefixes = []
+        child_lists = [[] for _ in self.uids]
+        for number, uid in enumerate(self.uids):
+            path = item_paths[uid]
+            header, links = _parse_item(blobs.get(path, ""), _item_format(path))
+            self.headers.append(header)
+            self.prefixes.append(prefixes[posixpath.dirname(path)])
+            for parent in links:
+                # links to items that aren't at the commit don't lead anywhere
+                if parent in numbers:
+                    child_lists[numbers[parent]].append(number)
+
+        self.offsets = array.array("l", [0])
+        self.children = array.array("l")
+        for child_list in child_lists:
+            self.children.extend(sorted(set(child_list)))
+            self.offsets.append(len(self.children))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = "{}.{}.tmp".format(self.cache_path, os.getpid())
+        with open(temp_file, "w", encoding="utf-8") as stream:
+            json.dump({"version": GRAPH_VERSION, "commit": self.commit, "uids": self.uids,
+                       "headers": self.headers, "prefixes": self.prefixes,
+                       "offsets": self.offsets.tolist(), "children": self.children.tolist()},
+                      stream, separators=(",", ":"))
+        os.replace(temp_file, self.cache_path)
+        log.info("Built link graph of %d items and %d links for %s", len(self.uids),
+                 len(self.children), self.commit)
+
+    def child_uids(self, uid):
+        """UIDs of the items that link to the item, empty if it isn't at the commit"""
+        number = self.numbers.get(str(uid))
+        if number is None:
+            return []
+        return [self.uids[child] for child in
+                self.children[self.offsets[number]:self.offsets[number + 1]]]
+
+    def _walk(self, uids):
+        """breadth first traversal from the items
+
+        :return: the numbers of the items that were found in the graph, and the depth and the
+                 item it was first reached through of each downstream item by number
+        """
+        numbers = self.numbers
+        seeds = sorted({numbers[str(uid)] for uid in uids if str(uid) in numbers})
+        depths = array.array("l", [-1]) * len(self.uids)
+        through = {}
+        queue = collections.deque(seeds)
+        for seed in seeds:
+            depths[seed] = 0
+        while queue:
+            number = queue.popleft()
+            for child in self.children[self.offsets[number]:self.offsets[number + 1]]:
+                if depths[child] < 0:
+                    depths[child] = depths[number] + 1
+                    through[child] = number
+                    queue.append(child)
+        return seeds, depths, through
+
+    def impact(self, changed):
+        """the items downstream of the changed and removed items that aren't changed
+            themselves
+
+        :param changed: UIDs of the changed items
+
+        :return: the changed UIDs that were found in the graph, the UIDs removed since the
+                 merge base, and for each impacted item its uid, header, prefix, depth (1 for
+                 a direct child) and the item it was reached through, closest items first
+        """
+        numbers = self.numbers
+        seeds, depths, through = self._walk(changed)
+        seed_uids = {self.uids[seed] for seed in seeds}
+        impacted = {}
+        for number in through:
+            impacted[self.uids[number]] = {
+                "uid": self.uids[number], "header": self.headers[number],
+                "prefix": self.prefixes[number], "depth": depths[number],
+                "through": self.uids[through[number]]}
+
+        removed = []
+        base = self.base_graph
+        if base is not None:
+            removed = [uid for uid in base.numbers if uid not in numbers]
+            _, base_depths, base_through = base._walk(removed)
+            for number in base_through:
+                uid = base.uids[number]
+                # items that were removed or changed too aren't impacted
+                if uid not in numbers or uid in seed_uids:
+                    continue
+                if uid in impacted and impacted[uid]["depth"] <= base_depths[number]:
+                    continue
+                impacted[uid] = {
+                    "uid": uid, "header": self.headers[numbers[uid]],
+                    "prefix": self.prefixes[numbers[uid]], "depth": base_depths[number],
+                    "through": base.uids[base_through[number]]}
+
+        impacted = sorted(impacted.values(), key=lambda entry: (entry["depth"], entry["uid"]))
+        log.info("%d changed and %d removed items have %d downstream items", len(seeds),
+                 len(removed), len(impacted))
+        return sorted(seed_uids), removed, impacted
+
+
+def changed_uids(tree):
+    """UIDs of the items that were written to the temp tree, the normatively changed ones"""
+    return [str(item.uid) for document in tree for item in document.items]
+
+
+def write_impact(publish_path, commit, changed, impacted, removed=None, base=None):
+    """export the impact analysis as data next to the published pages"""
+    path = os.path.join(publish_path, IMPACT_FILE)
+    with open(path, "w", encoding="utf-8") as stream:
+        json.dump({"commit": commit, "base": base, "changed": changed,
+                   "removed": removed or [], "impacted": impacted}, stream, indent=1)
+    return path
+
+
+def _count(count, one, many):
+    """the count with the singular or plural words"""
+    return "{} {}".format(count, one if count == 1 else many)
+
+
+def impact_section(impacted, removed=None):
+    """html for the impact section of the index page"""
+    note = ""
+    if removed:
+        note = ("<p>{} removed, the items that linked to {} are found in the links at the "
+                "merge base with the main branch.</p>\n").format(
+                    _count(len(removed), "item was", "items were"),
+                    "it" if len(removed) == 1 else "them")
+    if not impacted:
+        return ("<h3>Downstream Impact</h3>\n"
+                "<p>No other items link to the changed items.</p>\n" + note)
+    header = "".join("<th>{}</th>\n".format(column) for column in IMPACT_COLUMNS)
+    rows = []
+    for entry in impacted:
+        cells = [entry["uid"], html.escape(entry["header"]), entry["prefix"], entry["depth"],
+                 entry["through"]]
+        rows.append("<tr>\n{}</tr>\n".format("".join("<td>{}</td>\n".format(cell)
+                                                      for cell in cells)))
+    return ("<h3>Downstream Impact</h3>\n"
+            "<p>{c} to the changed items, directly or through other items, and "
+            "{a}n't part of the project.</p>\n"
+            "{n}<table>\n<thead>\n<tr>\n{h}</tr>\n</thead>\n<tbody>\n{r}</tbody>\n"
+            "</table>\n").format(c=_count(len(impacted), "item links", "items link"),
+                                  a="is" if len(impacted) == 1 else "are",
+                                  n=note, h=header, r="".join(rows))
+
+
+def publish_impact(link_graph, changed, publish_path):
+    """find the impact of the changed items, export it, and return the html section
+
+    :param link_graph: LinkGraph for the project commit, with the graph at the merge base to
+                       follow the removed items
+    :param changed: UIDs of the changed items
+    :param publish_path: folder to export impact.json to
+    """
+    changed, removed, impacted = link_graph.impact(changed)
+    base = link_graph.base_graph.commit if link_graph.base_graph is not None else None
+    write_impact(publish_path, link_graph.commit, changed, impacted, removed, base)
+    return impact_section(impacted, removed)
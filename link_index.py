@@ -0,0 +1,231 @@
+"""
+    Lazy link resolution against the full tree at the project commit.
+    The tree that is published for a project only has the changed documents in it, so links to
+    unchanged items can't be found in it.  Loading the whole doorstop tree is too slow, so an
+    index of item UID to file path is built once per commit and cached.  Linked items are only
+    read from git when they are referenced, all the ones a tree links to in one go.  The child
+    links of the unchanged items are found in the link graph of the commit.
+"""
+import json
+import os
+import posixpath
+import frontmatter
+import yaml
+
+from doorstop.common import DoorstopError
+from doorstop.core.item import UnknownItem
+from common import logger, ITEM_FORMAT_MARKDOWN
+from process_diff import _item_format
+from vcs_common import _rev_parse, _ls_tree, _show_file, _read_blobs
+
+log = logger(__name__)
+
+DEFAULT_CACHE_DIR = ".doorjamb_cache"
+INDEX_VERSION = 1
+DOCUMENT_CONFIG = ".doorstop.yml"
+
+
+class IndexedDocument:
+    """the parts of a document the item links need"""
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+
+class IndexedItem:
+    """an item read from git for link resolution.
+        Has the parts of a doorstop item that the link formatting uses.
+    """
+    def __init__(self, uid, header, prefix, path):
+        self.uid = uid
+        self.header = header
+        self.document = IndexedDocument(prefix)
+        self.path = path
+
+    def __str__(self):
+        return str(self.uid)
+
+
+def _document_prefixes(commit, paths):
+    """the prefix of each document folder at the commit, from the document configs"""
+    prefixes = {}
+    for path in paths:
+        if posixpath.basename(path) == DOCUMENT_CONFIG:
+            doc_path = posixpath.dirname(path)
+            config = yaml.safe_load(_show_file(commit, path)) or {}
+            prefixes[doc_path] = config.get("settings", {}).get("prefix",
+                                                              posixpath.basename(doc_path))
+    return prefixes
+
+
+def _parse_header(text, item_format):
+    """read the header of an item from the file text"""
+    try:
+        if item_format == ITEM_FORMAT_MARKDOWN:
+            data = frontmatter.loads(text).metadata
+        else:
+            data = yaml.safe_load(text)
+    except yaml.YAMLError as err:
+        log.warning("Could not parse item for its header: %s", err)
+        return ""
+    return str((data or {}).get("header") or "").strip()
+
+
+class LinkIndex:
+    """UID to file path index for all the items at a commit.
+        The index is cached in cache_dir by commit sha so it is only built once per commit.
+
+    :param commit: branch or commit to index
+    :param cache_dir: folder for the cached index files
+    :param graph: LinkGraph for the commit, to find the children of the items.  Without it
+                  only the children in the published tree are shown
+    """
+    def __init__(self, commit, cache_dir=None, graph=None):
+        self.commit = _rev_parse(commit)
+        self.cache_dir = cache_dir or DEFAULT_CACHE_DIR
+        self.graph = graph
+        self._index = None
+        self._items = {}
+
+    @property
+    def cache_path(self):
+        """file the index for this commit is cached in"""
+        return os.path.join(self.cache_dir, "uid-index-{}.json".format(self.commit))
+
+    @property
+    def index(self):
+        """the UID to [path, prefix] index, loaded or built on first use"""
+        if self._index is None:
+            self._index = self._load() or self._build()
+        return self._index
+
+    def _load(self):
+        """read the cached index for the commit"""
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as stream:
+                data = json.load(stream)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != INDEX_VERSION or data.get("commit") != self.commit:
+            return None
+        log.info("Loaded link index for %s from %s", self.commit, self.cache_path)
+        return data["items"]
+
+    def _build(self):
+        """index the item files at the commit, and cache the index"""
+        paths = _ls_tree(self.commit)
+        prefixes = _document_prefixes(self.commit, paths)
+
+        index = {}
+        for path in paths:
+            doc_path, file_name = posixpath.split(path)
+            if doc_path not in prefixes or file_name.startswith("."):
+                continue
+            if _item_format(file_name) is None:
+                continue
+            uid = posixpath.splitext(file_name)[0]
+            index[uid] = [path, prefixes[doc_path]]
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_file = "{}.{}.tmp".format(self.cache_path, os.getpid())
+        with open(temp_file, "w", encoding="utf-8") as stream:
+            json.dump({"version": INDEX_VERSION, "commit": self.commit, "items": index}, stream)
+        os.replace(temp_file, self.cache_path)
+        log.info("Built link index of %d items for %s", len(index), self.commit)
+        return index
+
+    def prepare(self):
+        """load or build the cached index and graph now, so the processes that share the
+            cache don't each build them"""
+        items = len(self.index)
+        graph_items = len(self.graph.numbers) if self.graph is not None else 0
+        log.info("Link index of %d items and graph of %d items ready for %s", items,
+                 graph_items, self.commit)
+
+    def read_items(self, uids):
+        """read the items for the UIDs that weren't read yet, through a single git process"""
+        entries = {}
+        for uid in uids:
+            uid = str(uid)
+            if uid in self._items or uid in entries:
+                continue
+            entry = self.index.get(uid)
+            if entry is None:
+                self._items[uid] = None
+            else:
+                entries[uid] = entry
+        if not entries:
+            return
+        blobs = _read_blobs(self.commit, [path for path, _ in entries.values()])
+        for uid, (path, prefix) in entries.items():
+            header = _parse_header(blobs.get(path, ""), _item_format(path))
+            self._items[uid] = IndexedItem(uid, header, prefix, path)
+        log.info("Read %d linked items from %s", len(entries), self.commit)
+
+    def find_item(self, uid):
+        """the item for the UID read from git, None if there is no such item at the commit"""
+        self.read_items([uid])
+        return self._items[str(uid)]
+
+    def child_uids(self, uid):
+        """UIDs of the items that link to the item at the commit, empty without a graph"""
+        if self.graph is None:
+            return []
+        return self.graph.child_uids(uid)
+
+
+class LazyTree:
+    """view over the published tree that falls back to the link index for linked items
+        that aren't in it.
+
+    :param tree: the doorstop tree of changed documents
+    :param index: LinkIndex for the project commit
+    """
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+        # UID to the page an item is published on, for split output
+        self.pages = {}
+        self._uids = None
+
+    def _published(self):
+        """UIDs of the items in the published tree.  The first time, the items they link to
+            and the ones that link to them are read from the index in one go"""
+        if self._uids is None:
+            items = [item for document in self.tree for item in document.items]
+            self._uids = {str(item.uid) for item in items}
+            linked = []
+            for item in items:
+                linked.extend(str(uid) for uid in item.links)
+                linked.extend(self.index.child_uids(item.uid))
+            self.index.read_items(uid for uid in linked if uid not in self._uids)
+        return self._uids
+
+    def find_item(self, uid):
+        """the item from the published tree, or the index, or an UnknownItem"""
+        try:
+            return self.tree.find_item(uid)
+        except DoorstopError:
+            pass
+        self._published()
+        item = self.index.find_item(uid)
+        if item is None:
+            return UnknownItem(uid)
+        return item
+
+    def parent_items(self, item):
+        """the items the item links to"""
+        return [self.find_item(uid) for uid in item.links]
+
+    def child_items(self, item):
+        """the items that link to the item, the ones in the published tree first.  Items
+            outside it are found in the link graph of the commit"""
+        children = item.find_child_items()
+        found = {str(child.uid) for child in children} | self._published()
+        for uid in self.index.child_uids(item.uid):
+            if uid not in found:
+                children.append(self.find_item(uid))
+        return children
+
+    def page(self, item):
+        """page the item is published on, empty if it is on the current page or unpublished"""
+        return self.pages.get(str(item.uid), "")
@@ -0,0 +1,376 @@
+"""
+    Turn the diff between the main and project branches into the project documents.
+    Each changed item file is parsed out of the diff with add/remove decorations and written
+    into a temp folder that is loaded as a doorstop tree for publishing.
+"""
+import hashlib
+import os
+import shutil
+import doorstop
+import frontmatter
+
+from common import (logger, DEFAULT_ITEMFORMAT, ITEM_FORMAT_MARKDOWN, ITEM_FORMAT_YAML,
+                    NON_NORMATIVE_FIELDS, REMOVED_LINE, ADDED_LINE, OVERVIEW_DOCUMENT,
+                    CODE_BLOCK_BOUNDARY, CODE_BLOCK_ONE_LINE, CODE_BLOCK_END, BLOCK_END,
+                    ADDED_BLOCK_START, REMOVED_BLOCK_START, TABLE_FIELDS)
+from publish_assets import ASSETS
+from publish_compress import CONTENT_MANIFEST
+
+log = logger(__name__)
+
+PUBLISH_FOLDER = "public"
+
+def _temp_path(project_branch):
+    """place to put the files for generating the alternate project requirement "documents"
+        This could also be a passed in parameter with a default to the branch name"""
+    return project_branch.replace('/', '_')
+
+def _prepare_temp_path(temp_path):
+    """first clear the temp path if it exists.  The published assets and the content hashes
+        are kept so they only need to be synced and compressed again when they change.
+
+    :return: the publish folder in the temp path
+    """
+    publish_folder = os.path.join(temp_path, PUBLISH_FOLDER)
+    _clear_folder(temp_path, keep=[publish_folder])
+    _clear_folder(publish_folder, keep=[os.path.join(publish_folder, ASSETS),
+                                        os.path.join(publish_folder, CONTENT_MANIFEST)])
+    # create the temp folder, and the output path
+    os.makedirs(temp_path, exist_ok=True)
+    os.makedirs(publish_folder, exist_ok=True)
+    return publish_folder
+
+def _build_tree(temp_path, doc_list):
+    """build the doorstop tree for the documents written to the temp path"""
+    documents = []
+
+    # need to get all the "documents" added.  Can we build the tree manually?
+    def add_docs(doc_path):
+        """Recursive method to check and add the document to the list, 
+            including any missing document levels"""
+        folders = os.path.split(doc_path)
+        if folders[0] != '' and folders[0] not in doc_list:
+            add_docs(folders[0])
+
+        document = doorstop.Document(os.path.join(os.path.abspath(temp_path), doc_path), None)
+        documents.append(document)
+
+    for doc in doc_list:
+        add_docs(doc)
+
+    return doorstop.Tree.from_list(documents, None)
+
+def _clear_folder(path, keep=None):
+    """delete everything in the folder except for the paths in keep"""
+    if not os.path.isdir(path):
+        return
+    keep = [os.path.normpath(keep_path) for keep_path in keep or []]
+    for entry in os.listdir(path):
+        entry_path = os.path.join(path, entry)
+        if os.path.normpath(entry_path) in keep:
+            continue
+        if os.path.isdir(entry_path) and not os.path.islink(entry_path):
+            shutil.rmtree(entry_path)
+        else:
+            os.remove(entry_path)
+
+def _item_format(file_path):
+    """item format for the file extension, None if the extension isn't valid for an item"""
+    _, file_ext = os.path.splitext(file_path)
+
+    # Ensure the file extension is valid,
+    # dev version of doorstop has EXTENSTIONS as a dictionary.
+    # trying to make this compatible for both.  Explains why the DEFAULT wasn't available.
+    if isinstance(doorstop.Item.EXTENSIONS, dict):
+        for accepted_format, exts in doorstop.Item.EXTENSIONS.items():
+            if file_ext.lower() in exts:
+                return accepted_format
+    else:
+        for exts in doorstop.Item.EXTENSIONS:
+            if file_ext.lower() in exts:
+                return DEFAULT_ITEMFORMAT
+    return None
+
+def _process_diff(patch_set, temp_path, after_only=False):
+    doc_list = []
+
+    for patched_file in patch_set:
+        _process_patched_file(patched_file, temp_path, doc_list, after_only)
+    return doc_list
+
+def _after_only_item(patched_file, item_format):
+    """the project side of an item, and if it had a normative change.
+        Used to publish only the added/after state, so none of the removed lines are kept
+        and no decorations are added.  Once a normative change is found the rest of the
+        lines are taken as they are.
+
+    :return: normative change flag, list of the item lines
+    """
+    current_item = []
+    normative_change = False
+    normative_field = False
+    delimiter_count = 0
+    if item_format == ITEM_FORMAT_MARKDOWN:
+        handler = frontmatter.YAMLHandler()
+
+    for hunk in patched_file:
+        for line in hunk:
+            if normative_change:
+                if not line.is_removed:
+                    current_item.append(line.value)
+                continue
+
+            if item_format == ITEM_FORMAT_MARKDOWN and handler.FM_BOUNDARY.search(line.value):
+                if line.is_added or line.is_context:
+                    current_item.append(line.value)
+                    delimiter_count += 1
+                continue
+
+            # only the field names matter here, to tell if a change is normative
+            if item_format == ITEM_FORMAT_YAML or delimiter_count == 1:
+                if not line.value.startswith((" ", "-")) and line.value.strip():
+                    field = line.value.split(':', 1)[0]
+                    normative_field = field not in NON_NORMATIVE_FIELDS
+
+            if (normative_field or delimiter_count >= 2) and (line.is_removed or line.is_added):
+                normative_change = True
+
+            if not line.is_removed:
+                current_item.append(line.value)
+
+    return normative_change, current_item
+
+class _CodeBlock:
+    """both sides of a code block from the diff.
+        A diagram can't be decorated line by line, so a block that changed is published
+        whole, once as it was and once as it is.  The sides are hashed as the lines are
+        read so an unchanged block is only published once, without decorations.
+
+    :param fence: the line that opened the block
+    """
+    def __init__(self, fence):
+        self.fence = fence
+        self.diff_lines = []
+        self.removed_hash = hashlib.sha1()
+        self.added_hash = hashlib.sha1()
+
+    def append(self, line):
+        """add a diff line in the block to the sides it belongs to"""
+        self.diff_lines.append(line)
+        value = line.value.encode("utf-8")
+        if not line.is_added:
+            self.removed_hash.update(value)
+        if not line.is_removed:
+            self.added_hash.update(value)
+
+    def _side(self, start, skip):
+        """the full block for one side, with its decoration"""
+        lines = [line.value for line in self.diff_lines if not skip(line)]
+        if not lines:
+            return []
+        return [start, self.fence] + lines + [CODE_BLOCK_END, BLOCK_END]
+
+    def lines(self, close=CODE_BLOCK_END):
+        """the item lines for the block
+
+        :param close: the line that closed the block
+        """
+        if self.removed_hash.digest() == self.added_hash.digest():
+            return ([self.fence] + [line.value for line in self.diff_lines if not line.is_removed]
+                    + [close])
+        return (self._side(REMOVED_BLOCK_START, lambda line: line.is_added) +
+                self._side(ADDED_BLOCK_START, lambda line: line.is_removed))
+
+def _process_patched_file(patched_file, temp_path, doc_list, after_only=False):
+    """process the diff of one item file, writing the item to the temp path if it has a
+        normative change.  The document path is added to doc_list.
+
+    :param after_only: only keep the project side of the item, without decorations
+
+    :return: True if the item had a normative change and was written
+    """
+    current_item = []
+    file_path = patched_file.path  # file name
+    file_name = os.path.basename(file_path)
+    _, file_ext = os.path.splitext(file_name)
+
+    log.info("file name : %s", file_path)
+
+    item_format = _item_format(file_path)
+    if item_format is None:
+        msg = f"'{file_path}' extension for itemformat {file_ext} not valid"
+        raise doorstop.DoorstopError(msg)
+
+    # check if we need to copy the .doorstop.yml file over to the temp location
+    doc_path = os.path.dirname(file_path)
+    temp_doc_path = os.path.join(temp_path, doc_path)
+
+    # skipping a folder is apparently a problem,
+    # so we need to account for intermediate documents that won't include any changes
+    def check_folders(path, path_list):
+        """recusrivly checks for and adds temp folders for the project comparison
+            Will also add intermediate folders for documents with no changes"""
+        folders = os.path.split(path)
+
+        if folders[0] != '' and folders[0] not in path_list:
+            check_folders(folders[0], path_list)
+
+        check_doc_path = os.path.join(temp_path, path)
+        temp_doc_config = os.path.join(check_doc_path, ".doorstop.yml")
+        if not os.path.exists(check_doc_path):
+            os.makedirs(check_doc_path, exist_ok=True)
+        if not os.path.isfile(temp_doc_config):
+            shutil.copy(os.path.join(path, ".doorstop.yml"), temp_doc_config)
+
+    if after_only:
+        # a removed item has no after state to publish
+        if patched_file.is_removed_file:
+            return False
+        normative_change, current_item = _after_only_item(patched_file, item_format)
+        if not normative_change:
+            return False
+        check_folders(doc_path, doc_list)
+        # the lines are the item as committed on the project branch, so there is no
+        # decorated yaml to check before writing it
+        doorstop.common.write_lines(current_item, os.path.join(temp_doc_path, file_name), "")
+        if doc_path not in doc_list:
+            doc_list.append(doc_path)
+        return True
+
+    check_folders(doc_path, doc_list)
+
+    normative_change = False
+    delimiter_count = 0
+    if item_format == ITEM_FORMAT_MARKDOWN:
+        handler = frontmatter.YAMLHandler()
+
+    current_field = ''
+    current_value = ''
+    normative_field = False
+    table_field = False
+    in_code_block = False
+    field_line = False
+    code_block = None
+    removed_field_values = {}
+
+    # we should have included enough context lines that there is only one hunk per file
+    for hunk in patched_file:
+        for line in hunk:
+            field_line = False
+            current_value = ''
+            # normal parsers to tell.  So will just have to use the delimiters manually.
+            if item_format == ITEM_FORMAT_MARKDOWN:
+                if handler.FM_BOUNDARY.search(line.value):
+                    if line.is_added or line.is_context:
+                        current_item.append(line.value)
+                        delimiter_count += 1
+                        continue
+
+            # only want to check the field name when in the yaml section
+            # this should allow for multi-line field values
+            if item_format == ITEM_FORMAT_YAML or delimiter_count == 1:
+                if not line.value.startswith(" ") and not line.value.startswith("-"):
+                    field, value = line.value.split(':', 2)
+                    field_line = True
+                    current_value = value
+                    if field != current_field:
+                        current_field = field
+                        normative_field = field not in NON_NORMATIVE_FIELDS
+                        table_field = field in TABLE_FIELDS
+
+            # declare a normative change so the file gets added to the document/tree
+            # potential problem with MD files here as the header will be included
+            # if there is one
+            if normative_field or delimiter_count >= 2:
+                if line.is_removed or line.is_added:
+                    normative_change = True
+            
+            # declare a dictionary of field names and list of removed lines
+            # Add value to dictionary for removed normative lines from each field.
+            # For added lines for each field, check if there were removed lines
+            # and if so, change the values to be multi-line and add in the decorations
+            if current_field not in removed_field_values:
+                removed_field_values[current_field] = []
+
+            if normative_field and normative_change and field_line and table_field:
+                if line.is_removed:
+                    removed_field_values[current_field].append(current_value)
+                    continue
+
+                if len(removed_field_values[current_field]) > 0:
+                    current_item.append(f"{field}: |\r\n")
+                    for r_value in removed_field_values[current_field]:
+                        current_item.append(REMOVED_LINE.format(r_value.strip()))
+                    if current_value.strip() != '':
+                        if line.is_added:
+                            current_item.append(ADDED_LINE.format(current_value.strip()))
+                        else:
+                            current_item.append(f"  {current_value}\r\n")
+                    continue
+
+            doc_name = os.path.split(os.path.dirname(patched_file.path))[1]
+            # we only want to decorate the added and removed lines in the text section
+            # don't want to do an decoration on the overview document
+            if doc_name.lower() != OVERVIEW_DOCUMENT.lower():
+                if ((current_field == "text" and line.value.startswith(" ")) or
+                    delimiter_count >= 2):
+                    # check if we are starting a code section
+                    if CODE_BLOCK_ONE_LINE.search(line.value):
+                        # one line code block.  We might want to decorate this one,
+                        # but we will need to add separate lines
+                        if line.is_removed:
+                            current_item.append(REMOVED_BLOCK_START)
+                            current_item.append(line.value.strip())
+                            current_item.append(BLOCK_END)
+                        elif line.is_added:
+                            current_item.append(ADDED_BLOCK_START)
+                            current_item.append(line.value.strip())
+                            current_item.append(BLOCK_END)
+                        else:
+                            current_item.append(line.value)
+                        continue
+                    if CODE_BLOCK_BOUNDARY.search(line.value):
+                        if in_code_block:
+                            in_code_block = False
+                            current_item.extend(code_block.lines(line.value))
+                        else:
+                            in_code_block = True
+                            code_block = _CodeBlock(line.value)
+                        continue
+                    if in_code_block:
+                        code_block.append(line)
+                        continue
+                    if len(line.value.strip()) >= 0:
+                        if line.is_removed:
+                            current_item.append(REMOVED_LINE.format(line.value.strip()))
+                        elif line.is_added:
+                            current_item.append(ADDED_LINE.format(line.value.strip()))
+                        else:
+                            current_item.append(line.value)
+                        continue
+
+            # do not add removed lines from the other fields
+            # do add all lines for a file that was deleted.
+            if line.is_added or line.is_context or patched_file.is_removed_file:
+                current_item.append(line.value)
+
+    # a block that isn't closed before the end of the item is still published
+    if in_code_block:
+        current_item.extend(code_block.lines())
+
+    # working on checking to make sure the normative parts of the file have changed
+    # before adding the file to the project folder.
+    # need to be able to load yaml and md files here.
+    # Plus will the parsing we are doing in the loop above work
+    # with MD files and yaml front matter?
+    if normative_change:
+        if item_format == ITEM_FORMAT_YAML:
+            whatisThis = doorstop.common.load_yaml(''.join(current_item), '')
+        elif item_format == ITEM_FORMAT_MARKDOWN:
+            whatisThis = doorstop.common.load_markdown(''.join(current_item), '',
+                                                    doorstop.Item.MARKDOWN_TEXT_ATTRIBUTES)
+        doorstop.common.write_lines(current_item, os.path.join(temp_doc_path, file_name), "")
+        if doc_path not in doc_list:
+            doc_list.append(doc_path)
+        return True
+    return False
@@ -0,0 +1,294 @@
+"""
+    Asset syncing for the published output.
+    Only assets whose content changed are copied into the publish folder.  When a shared
+    asset store is given the content is kept once per hash in the store and hardlinked into
+    each publish folder.  A manifest of what was done is left in the assets folder, it is
+    served with the site so it doesn't hold any paths of the machine that built it.
+    The stylesheets the pages use are bundled into one minified file.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import doorstop
+
+from common import logger
+
+log = logger(__name__)
+
+ASSETS = "assets"
+ASSET_MANIFEST = "manifest.json"
+HASH_BLOCK_SIZE = 1 << 16
+
+# doorstop has moved the html assets around between versions, use the first one found
+DOORSTOP_ASSET_DIRS = [
+    os.path.join("files", "assets"),
+    os.path.join("files", "templates", "html"),
+]
+
+# the stylesheets base.tpl links, in order, and the bundle the pages link instead
+BUNDLE_STYLESHEETS = [
+    "doorstop/bootstrap.min.css",
+    "doorstop/general.css",
+    "doorstop/sidebar.css",
+]
+CSS_BUNDLE = "doorstop/bundle.min.css"
+# strings, urls and /*! comments, they are licenses, are kept as they are, the other
+# comments are dropped, and braces open and close the blocks
+CSS_TOKEN = re.compile(r"""
+    (?P<string>"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'
+        |url\((?:[^)"']|"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')*\)|/\*!.*?\*/)
+    |(?P<comment>/\*.*?\*/)
+    |(?P<brace>[{}])
+    """, re.DOTALL | re.IGNORECASE | re.VERBOSE)
+CSS_SPACE = re.compile(r"\s+")
+CSS_PUNCTUATION = re.compile(r"\s*([;,>])\s*")
+CSS_COLON = re.compile(r"\s*:\s*")
+# at-rules with blocks of rules rather than declarations
+CSS_GROUP_RULES = ("@media", "@supports", "@document", "@layer", "@container")
+
+ACTION_COPIED = "copied"
+ACTION_LINKED = "linked"
+ACTION_UNCHANGED = "unchanged"
+
+
+def _doorstop_assets():
+    """find the folder of doorstop html assets for the installed version of doorstop"""
+    core_path = os.path.dirname(doorstop.core.__file__)
+    for asset_dir in DOORSTOP_ASSET_DIRS:
+        check_path = os.path.join(core_path, asset_dir)
+        if os.path.isdir(os.path.join(check_path, "doorstop")):
+            return check_path
+    log.warning("Could not find the doorstop html assets in %s", core_path)
+    return None
+
+
+def default_asset_sources():
+    """list of (source, destination) pairs making up the assets of a publish folder.
+        Later entries override earlier ones with the same destination.
+    """
+    file_path = os.path.dirname(os.path.realpath(__file__))
+    sources = []
+    doorstop_assets = _doorstop_assets()
+    if doorstop_assets:
+        sources.append((doorstop_assets, ""))
+    sources.append((os.path.join(file_path, "templates"), "doorstop"))
+    sources.append((os.path.join(file_path, "resources", "key.png"), os.path.join("doorstop", "key.png")))
+    return sources
+
+
+def _iter_asset_sources(sources):
+    """Yield the relative destination and source file for each asset file"""
+    for source, dest in sources:
+        if os.path.isfile(source):
+            yield dest.replace("\\", "/"), source
+            continue
+        for root, _, files in os.walk(source):
+            for file_name in files:
+                src_file = os.path.join(root, file_name)
+                rel_path = os.path.join(dest, os.path.relpath(src_file, source))
+                yield rel_path.replace("\\", "/"), src_file
+
+
+def _file_hash(path):
+    """sha256 of the file contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _load_manifest(manifest_path):
+    """Read the manifest from the last sync, an empty manifest if there isn't one"""
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as stream:
+            return json.load(stream)
+    except (OSError, ValueError):
+        return {}
+
+
+def _source_key(src):
+    """stands in for the source path in the manifest, to see if an asset comes from the same
+        file as last time"""
+    return hashlib.sha256(os.path.abspath(src).encode("utf-8")).hexdigest()[:16]
+
+
+def _store_path(store, digest):
+    """location of the content in the content addressed store"""
+    return os.path.join(store, digest[:2], digest)
+
+
+def _add_to_store(src, store, digest):
+    """copy the source file into the store if the content isn't there already"""
+    stored = _store_path(store, digest)
+    if not os.path.isfile(stored):
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        temp_file = "{}.{}.tmp".format(stored, os.getpid())
+        shutil.copyfile(src, temp_file)
+        os.replace(temp_file, stored)
+    return stored
+
+
+def _place_asset(src, dest, digest, store):
+    """put the asset in the publish folder, hardlinked from the store when possible"""
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    # never write through an existing file, it may be a hardlink into the store
+    if os.path.lexists(dest):
+        os.unlink(dest)
+    if store:
+        stored = _add_to_store(src, store, digest)
+        try:
+            os.link(stored, dest)
+            return ACTION_LINKED
+        except OSError as err:
+            log.debug("Could not hardlink %s (%s), copying instead", stored, err)
+    shutil.copyfile(src, dest)
+    return ACTION_COPIED
+
+
+def _minify_css(text):
+    """strip the comments and the whitespace css doesn't need.  Strings and urls are kept as
+        they are, and the space around colons is only removed in declaration blocks, in a
+        selector like "a :hover" the space is a descendant combinator.
+    """
+    # a comment still separates what is on either side of it
+    text = CSS_TOKEN.sub(lambda match: " " if match.group("comment") else match.group(0), text)
+
+    def _code(code, declarations):
+        code = CSS_PUNCTUATION.sub(r"\1", CSS_SPACE.sub(" ", code))
+        return CSS_COLON.sub(":", code) if declarations else code
+
+    parts = []
+    # if each open block holds declarations, the top level holds rules
+    blocks = [False]
+    prelude = ""
+    position = 0
+    for match in CSS_TOKEN.finditer(text):
+        code = _code(text[position:match.start()], blocks[-1])
+        parts.append(code)
+        position = match.end()
+        if match.group("string"):
+            parts.append(match.group("string"))
+            prelude = (prelude + code).rsplit(";", 1)[-1] + match.group("string")
+            continue
+
+        prelude = (prelude + code).rsplit(";", 1)[-1]
+        parts[-1] = parts[-1].rstrip()
+        if match.group("brace") == "{":
+            blocks.append(not prelude.strip().lower().startswith(CSS_GROUP_RULES))
+        else:
+            if parts[-1].endswith(";"):
+                parts[-1] = parts[-1][:-1]
+            if len(blocks) > 1:
+                blocks.pop()
+        parts.append(match.group("brace"))
+        prelude = ""
+        # nor is the space after a brace
+        while position < len(text) and text[position].isspace():
+            position += 1
+    parts.append(_code(text[position:], blocks[-1]))
+    return "".join(parts).strip()
+
+
+def _write_css_bundle(assets_dir, files):
+    """bundle the stylesheets into one minified file
+
+    :param files: the synced assets from the manifest
+    :return: the sha256 of the bundle, None if none of the stylesheets are there
+    """
+    parts = []
+    for rel_path in BUNDLE_STYLESHEETS:
+        if rel_path not in files:
+            continue
+        with open(os.path.join(assets_dir, rel_path), "r", encoding="utf-8") as stream:
+            parts.append(_minify_css(stream.read()))
+    if not parts:
+        return None
+    text = "\n".join(parts) + "\n"
+
+    # written to a new file, the old one may be a hardlink into another publish folder
+    bundle_path = os.path.join(assets_dir, CSS_BUNDLE)
+    temp_file = "{}.{}.tmp".format(bundle_path, os.getpid())
+    with open(temp_file, "w", encoding="utf-8", newline="\n") as stream:
+        stream.write(text)
+    os.replace(temp_file, bundle_path)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def css_bundle(manifest):
+    """the stylesheet bundle for the pages to link from the manifest sync_assets wrote
+
+    :return: path of the bundle in the assets folder, None when it wasn't written
+    """
+    bundle = manifest.get("bundle")
+    return bundle["path"] if bundle else None
+
+
+def sync_assets(publish_path, sources=None, store=None):
+    """Sync the html assets into the assets folder of the publish path
+
+    :param publish_path: the folder the html was published to
+    :param sources: list of (source, destination) pairs, defaults to the doorstop and local assets
+    :param store: optional folder of a shared content addressed asset store
+
+    :return: the manifest that was written
+    """
+    if sources is None:
+        sources = default_asset_sources()
+    assets_dir = os.path.join(publish_path, ASSETS)
+    manifest_path = os.path.join(assets_dir, ASSET_MANIFEST)
+    previous_manifest = _load_manifest(manifest_path)
+    previous = previous_manifest.get("files", {})
+
+    # later sources override earlier ones
+    assets = dict(_iter_asset_sources(sources))
+
+    files = {}
+    for rel_path, src in sorted(assets.items()):
+        stat = os.stat(src)
+        dest = os.path.join(assets_dir, rel_path)
+        old = previous.get(rel_path, {})
+        source = _source_key(src)
+
+        # only hash the source again if it looks like it was touched
+        if (old.get("source") == source and old.get("size") == stat.st_size and
+                old.get("mtime") == stat.st_mtime):
+            digest = old["sha256"]
+        else:
+            digest = _file_hash(src)
+
+        if (old.get("sha256") == digest and os.path.isfile(dest) and
+                os.path.getsize(dest) == stat.st_size):
+            action = ACTION_UNCHANGED
+        else:
+            action = _place_asset(src, dest, digest, store)
+
+        files[rel_path] = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime,
+                           "source": source, "action": action}
+
+    removed = sorted(rel_path for rel_path in previous if rel_path not in files)
+    for rel_path in removed:
+        dest = os.path.join(assets_dir, rel_path)
+        if os.path.lexists(dest):
+            os.unlink(dest)
+
+    bundle = previous_manifest.get("bundle")
+    if (not bundle or not os.path.isfile(os.path.join(assets_dir, CSS_BUNDLE)) or
+            any(files[rel_path]["action"] != ACTION_UNCHANGED
+                for rel_path in BUNDLE_STYLESHEETS if rel_path in files)):
+        digest = _write_css_bundle(assets_dir, files)
+        bundle = {"path": CSS_BUNDLE, "sha256": digest} if digest else None
+
+    manifest = {"store": bool(store),
+                "files": files, "removed": removed, "bundle": bundle}
+    os.makedirs(assets_dir, exist_ok=True)
+    with open(manifest_path, "w", encoding="utf-8") as stream:
+        json.dump(manifest, stream, indent=2, sort_keys=True)
+
+    counts = {}
+    for entry in files.values():
+        counts[entry["action"]] = counts.get(entry["action"], 0) + 1
+    log.info("Synced assets to %s: %s, %d removed", assets_dir, counts, len(removed))
+    return manifest
@@ -0,0 +1,135 @@
+"""
+    Precompressed copies of the published output.
+    gzip copies of the text files, and Brotli copies when the brotli package is installed, are
+    written next to them at publish time so a server can send them as they are.  A manifest of
+    the content hash of every file is written too, serve.py uses it for strong ETags.
+"""
+import gzip
+import hashlib
+import json
+import os
+
+from common import logger
+
+try:
+    import brotli
+except ImportError:
+    # optional, only the gzip copies are written without it
+    brotli = None
+
+log = logger(__name__)
+
+CONTENT_MANIFEST = "content.json"
+COMPRESS_EXTENSIONS = (".html", ".css", ".js", ".json", ".svg", ".txt", ".xml")
+# small files aren't worth a second request header
+MIN_COMPRESS_SIZE = 256
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# the encodings in the order a server should prefer them, and the suffix of their copies
+ENCODINGS = {
+    "br": ".br",
+    "gzip": ".gz",
+}
+
+
+def available_encodings():
+    """the encodings copies can be written for"""
+    return [encoding for encoding in ENCODINGS if encoding != "br" or brotli is not None]
+
+
+def variant_path(path, encoding):
+    """file name of the compressed copy of a file"""
+    return path + ENCODINGS[encoding]
+
+
+def _compress(data, encoding):
+    """compress the data with the encoding"""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime of 0 so the same content always gives the same copy
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _write_file(path, data):
+    """write a file by replacing it, the old one may be a hardlink into another site"""
+    temp_file = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_file, "wb") as stream:
+        stream.write(data)
+    os.replace(temp_file, path)
+
+
+def load_content_manifest(publish_path):
+    """the content hashes from the last time the site was compressed"""
+    try:
+        with open(os.path.join(publish_path, CONTENT_MANIFEST), "r", encoding="utf-8") as stream:
+            return json.load(stream).get("files", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def compress_site(publish_path):
+    """hash every published file, and write the compressed copies of the text files.
+        Files that look untouched since the last time keep their hash and copies, and files
+        with the same content keep their copies.
+
+    :param publish_path: the folder the site was published to
+
+    :return: the content hash, size and compressed encodings of each file by relative path
+    """
+    previous = load_content_manifest(publish_path)
+    encodings = available_encodings()
+    suffixes = tuple(ENCODINGS.values())
+
+    files = {}
+    variants = []
+    counts = {"compressed": 0, "hashed": 0, "unchanged": 0}
+    for root, _, names in os.walk(publish_path):
+        for name in names:
+            path = os.path.join(root, name)
+            rel_path = os.path.relpath(path, publish_path).replace("\\", "/")
+            if rel_path == CONTENT_MANIFEST or name.endswith(".tmp"):
+                continue
+            if name.endswith(suffixes):
+                variants.append(path)
+                continue
+
+            stat = os.stat(path)
+            old = previous.get(rel_path, {})
+            if (old.get("size") == stat.st_size and old.get("mtime") == stat.st_mtime and
+                    all(os.path.isfile(variant_path(path, encoding))
+                        for encoding in old.get("encodings", []))):
+                files[rel_path] = old
+                counts["unchanged"] += 1
+                continue
+
+            with open(path, "rb") as stream:
+                data = stream.read()
+            digest = hashlib.sha256(data).hexdigest()
+            counts["hashed"] += 1
+            compressed = []
+            if name.lower().endswith(COMPRESS_EXTENSIONS) and len(data) >= MIN_COMPRESS_SIZE:
+                for encoding in encodings:
+                    variant = variant_path(path, encoding)
+                    if old.get("sha256") != digest or not os.path.isfile(variant):
+                        variant_data = _compress(data, encoding)
+                        if len(variant_data) >= len(data):
+                            continue
+                        _write_file(variant, variant_data)
+                        counts["compressed"] += 1
+                    compressed.append(encoding)
+            files[rel_path] = {"sha256": digest, "size": stat.st_size, "mtime": stat.st_mtime,
+                               "encodings": compressed}
+
+    # copies of files that were removed, or that don't compress any more
+    for variant in variants:
+        base, suffix = os.path.splitext(variant)
+        rel_path = os.path.relpath(base, publish_path).replace("\\", "/")
+        encoding = next(encoding for encoding in ENCODINGS if ENCODINGS[encoding] == suffix)
+        if encoding not in files.get(rel_path, {}).get("encodings", []):
+            os.remove(variant)
+
+    text = json.dumps({"files": files}, indent=2, sort_keys=True)
+    _write_file(os.path.join(publish_path, CONTENT_MANIFEST), text.encode("utf-8"))
+    log.info("Compressed %s: %s, encodings %s", publish_path, counts, encodings)
+    return files
@@ -1,287 +1,487 @@
-"""
-    project publish will try to publish all the documents into a single page
-    The OVR (overview) document will have special purpose as a header and 
-    project overview.
-"""
-import os
-#import shutil
-import bottle
-import doorstop
-import markdown
-
-#from itertools import chain
-from bottle import template as bottle_template
-from doorstop.core.types import is_item, is_tree, iter_documents, iter_items, is_document, Prefix
-from common import log, OVERVIEW_DOCUMENT, REQUIREMENTS_DOCUMENT, TABLES_DOCUMENT
-from publish_common import (_format_md_ref, _format_md_references, _format_md_links,
-                           _format_md_label_links, _format_md_attr_list)
-from publish_table import _tab_lines_markdown
-#from vcs_common import _check_active_branch, _check_branch_fastforward, _read_branch_diff
-
-
-def publish_project(obj, project_name, publish_path):
-    """method to publish a project which is the difference between two branches in doorstop
-    requirements.
-    A project will have different publishing requirements.  We don't want to split up all 
-    the documents into separate pages, we should be able to get everything into a single 
-    html page.
-    
-    :param obj: the tree where the requirements are stored
-    :param project_name: the name of the project.  This should match the branch name, and the name
-                         of the overview document item
-    :param path: the local folder to publish the files to.
-    
-    Currently only html will be supported.
-
-    The overview document is currently hard coded.  But we could base this on some attribute of the 
-    document configiration "yml" instead
-    
-    1. generate the html for the overview document item for this project.
-    2. generate the html for each of the other document types with changes for this project.
-    3. any table changes should be generated last.
-
-    This is a different way to publish the requirements from doorstop, so we can't just override the
-    line generation methods
-    """
-    template=doorstop.publisher.HTMLTEMPLATE
-
-    if not is_tree(obj):
-        return
-
-    if publish_path == None:
-        publish_path = "public"
-
-    doc_lines = {}
-    for obj2, path2 in iter_documents(obj, publish_path, ".html"):
-        doc_lines[obj2.prefix] = publish_lines(obj2, ".html")
-
-    lines = []
-    special_doc_types = [Prefix(OVERVIEW_DOCUMENT), Prefix(REQUIREMENTS_DOCUMENT), 
-                         Prefix(TABLES_DOCUMENT)]
-    for doc_type in special_doc_types:
-        lines.extend(doc_lines[doc_type])
-
-    for prefix, line in doc_lines.items():
-        if prefix in special_doc_types:
-            continue
-        lines.extend(line)
-
-    body = ""
-    for it in lines:
-        for element in it:
-            body += element
-
-    try:
-        bottle.TEMPLATE_PATH.insert(
-            0, os.path.join(os.path.dirname(__file__), "views"))
-        if "baseurl" not in bottle.SimpleTemplate.defaults:
-            bottle.SimpleTemplate.defaults["baseurl"] = ""
-        html = bottle_template(template, body=body, toc="", parent=obj.parent, document=obj)
-    except Exception:
-        log.error("Problem parsing the template %s", template)
-        raise
-    html = html.split(os.linesep)
-
-    doorstop.common.write_lines(html, os.path.join(publish_path, "index.html"), 
-                                end=doorstop.settings.WRITE_LINESEPERATOR)
-
-    # take this out for now
-    # if obj2.copy_assets(assets_dir):
-    #     log.info("Copied assets from %s to %s", obj.assets, assets_dir)
-
-def _req_lines_markdown(obj, **kwargs):
-    """Yield lines for a Markdown report.
-
-    :param obj: Item, list of Items, or Document to publish
-    :param linkify: turn links into hyperlinks (for conversion to HTML)
-
-    :return: iterator of lines of text
-
-    """
-    linkify = kwargs.get("linkify", False)
-    to_html = kwargs.get("to_html", False)
-    for item in iter_items(obj):
-        text_lines = item.text.splitlines()
-
-        if item.heading:
-            if item.header:
-                text_lines.insert(0, item.header)
-            # Level and Text
-            standard = "- {t}".format(t=text_lines[0] if text_lines else "")
-            attr_list = _format_md_attr_list(item, True)
-            yield ""
-            yield standard + attr_list
-            yield from text_lines[1:]
-        else:
-            uid = item.uid
-            if item.header:
-                uid = "- {h} <small>{u}</small>".format(h=item.header, u=item.uid)
-            else:
-                uid = "- <small>[{u}]</small>".format(u=item.uid)
-
-            # Level and UID
-            standard = "{u}".format(u=uid)
-
-            t = text_lines[0] if text_lines else ""
-
-            attr_list = _format_md_attr_list(item, True)
-            yield standard + " " + t
-            # Text
-            if item.text:
-                yield from text_lines[1:]
-            # Reference
-            if item.ref:
-                yield ""  # break before reference
-                yield _format_md_ref(item)
-            # Reference
-            if item.references:
-                yield ""  # break before reference
-                yield _format_md_references(item)
-            # Parent links
-            if item.links:
-                yield ""  # break before links
-                items2 = item.parent_items
-                label = "Parent links:"
-                links = _format_md_links(items2, linkify, to_html=to_html)
-                label_links = _format_md_label_links(label, links, linkify)
-                yield label_links
-            # Child links
-            items2 = item.find_child_items()
-            if items2:
-                yield ""  # break before links
-                label = "Child links:"
-                links = _format_md_links(items2, linkify, to_html=to_html)
-                label_links = _format_md_label_links(label, links, linkify)
-                yield label_links
-            # Add custom publish attributes
-            if item.document and item.document.publish:
-                header_printed = False
-                for attr in item.document.publish:
-                    if not item.attribute(attr):
-                        continue
-                    if not header_printed:
-                        header_printed = True
-                        yield ""
-                        yield "| Attribute | Value |"
-                        yield "| --------- | ----- |"
-                    yield "| {} | {} |".format(attr, item.attribute(attr))
-                yield ""
-
-def _ovr_lines_markdown(obj, **kwargs):
-    """Yield lines for a Markdown report.
-
-    :param obj: Item, list of Items, or Document to publish
-    :param linkify: turn links into hyperlinks (for conversion to HTML)
-
-    :return: iterator of lines of text
-
-    """
-    linkify = kwargs.get("linkify", False)
-    to_html = kwargs.get("to_html", False)
-    for item in iter_items(obj):
-        text_lines = item.text.splitlines()
-        if item.header:
-            yield ""
-            yield f"##### {item.header}"
-            yield ""
-        # Text
-        if item.text:
-            yield from text_lines[0:]
-        # Reference
-        if item.ref:
-            yield ""  # break before reference
-            yield _format_md_ref(item)
-        # Reference
-        if item.references:
-            yield ""  # break before reference
-            yield _format_md_references(item)
-        # Parent links
-        if item.links:
-            yield ""  # break before links
-            items2 = item.parent_items
-            label = "Parent links:"
-            links = _format_md_links(items2, linkify, to_html=to_html)
-            label_links = _format_md_label_links(label, links, linkify)
-            yield label_links
-        # Child links
-        items2 = item.find_child_items()
-        if items2:
-            yield ""  # break before links
-            label = "Child links:"
-            links = _format_md_links(items2, linkify, to_html=to_html)
-            label_links = _format_md_label_links(label, links, linkify)
-            yield label_links
-        # Add custom publish attributes
-        if item.document and item.document.publish:
-            header_printed = False
-            for attr in item.document.publish:
-                if not item.attribute(attr):
-                    continue
-                if not header_printed:
-                    header_printed = True
-                    yield ""
-                    yield "| Attribute | Value |"
-                    yield "| --------- | ----- |"
-                yield "| {} | {} |".format(attr, item.attribute(attr))
-            yield ""
-
-def _lines_overview(obj):
-    # Determine if a full HTML document should be generated
-    extensions=doorstop.publisher.EXTENSIONS
-
-    text = "\n".join(_ovr_lines_markdown(obj, linkify=False, to_html=True))
-    if len(text) > 0:
-        text = "### Overview\n" + text
-    body = markdown.markdown(text, extensions=extensions)
-
-    yield body
-
-def _lines_requirements(obj):
-    extensions=doorstop.publisher.EXTENSIONS
-
-    text = "\n".join(_req_lines_markdown(obj, linkify=False, to_html=True))
-    if len(text) > 0:
-        text = "### Requirements Changes\n" + text
-    body = markdown.markdown(text, extensions=extensions)
-    yield body
-
-def _lines_tables(obj):
-    extensions=doorstop.publisher.EXTENSIONS
-
-    text = "\n".join(_tab_lines_markdown(obj, linkify=False, to_html=True))
-    if len(text) > 0:
-        text = "### Table Changes\n" + text
-    body = markdown.markdown(text, extensions=extensions)
-    yield body
-
-PUBLISH_GENERATORS = {
-    "REQ" : _lines_requirements,
-    "OVR" : _lines_overview,
-    "TAB" : _lines_tables,
-}
-
-def get_generator(obj, ext):
-    """find the lines generator for the obj type"""
-    if is_document(obj):
-        doc_name = "{}".format(obj.prefix)
-    elif is_item(obj):
-        doc_name = "{}".format(obj.document.prefix)
-
-    doc_types = ", ".join(doc for doc in PUBLISH_GENERATORS)
-    msg = "Unknown document type: {} (options: {})".format(doc_name, doc_types)
-    #exc = doorstop.DoorstopError(msg)
-
-    try:
-        gen = PUBLISH_GENERATORS[doc_name]
-    except KeyError:
-        log.error(msg)
-        gen = PUBLISH_GENERATORS["REQ"]
-    return gen
-
-def publish_lines(obj, ext='.txt', **kwargs):
-    """method to return the lines for various document types"""
-    gen = get_generator(obj, ext)
-    yield from gen(obj, **kwargs)
-
-# tree = doorstop.build()
+"""
+    project publish will try to publish all the documents into a single page
+    The OVR (overview) document will have special purpose as a header and 
+    project overview.
+"""
+import os
+#import shutil
+import doorstop
+
+#from itertools import chain
+from doorstop.core.types import is_item, is_tree, iter_documents, iter_items, is_document, Prefix
+from common import log, OVERVIEW_DOCUMENT, REQUIREMENTS_DOCUMENT, TABLES_DOCUMENT
+from publish_common import (_format_md_ref, _format_md_references, _format_md_links,
+                           _format_md_label_links, _format_md_attr_list)
+from publish_table import _tab_lines_html_table
+from publish_assets import sync_assets, css_bundle
+from publish_compress import compress_site
+from renderer import get_renderer
+from link_index import LazyTree
+from search_index import SearchIndex
+from impact import publish_impact, changed_uids
+#from vcs_common import _check_active_branch, _check_branch_fastforward, _read_branch_diff
+
+
+INDEX = "index.html"
+SPECIAL_DOC_TYPES = [OVERVIEW_DOCUMENT, REQUIREMENTS_DOCUMENT, TABLES_DOCUMENT]
+
+def publish_project(obj, project_name, publish_path, asset_store=None, split=False,
+                    items_per_page=None, link_index=None, search=False, link_graph=None):
+    """method to publish a project which is the difference between two branches in doorstop
+    requirements.
+    A project will have different publishing requirements.  We don't want to split up all 
+    the documents into separate pages, we should be able to get everything into a single 
+    html page.
+    
+    :param obj: the tree where the requirements are stored
+    :param project_name: the name of the project.  This should match the branch name, and the name
+                         of the overview document item
+    :param path: the local folder to publish the files to.
+    :param asset_store: optional shared asset store to hardlink the html assets from
+    :param split: write a small index page with the overview and a list of sections, and
+                  each section on its own page instead of everything in one page
+    :param items_per_page: with split, the most items on a section page.  Defaults to one
+                           page per document
+    :param link_index: LinkIndex for the project commit, to resolve links to items that
+                       aren't part of the project
+    :param search: write a search index of the published items, and a search box on the
+                   pages
+    :param link_graph: LinkGraph for the project commit, to add a section with the items
+                       downstream of the changed items, and export them to impact.json
+    
+    Currently only html will be supported.
+
+    The overview document is currently hard coded.  But we could base this on some attribute of the 
+    document configiration "yml" instead
+    
+    1. generate the html for the overview document item for this project.
+    2. generate the html for each of the other document types with changes for this project.
+    3. any table changes should be generated last.
+
+    This is a different way to publish the requirements from doorstop, so we can't just override the
+    line generation methods
+    """
+    renderer = get_renderer()
+
+    if not is_tree(obj):
+        return
+
+    if publish_path == None:
+        publish_path = "public"
+
+    links_tree = LazyTree(obj, link_index) if link_index is not None else None
+    search_index = SearchIndex() if search else None
+    appendix = ""
+    if link_graph is not None:
+        appendix = publish_impact(link_graph, changed_uids(obj), publish_path)
+
+    # the assets go first, the pages only link the stylesheet bundle when it was written
+    bundle = css_bundle(sync_assets(publish_path, store=asset_store))
+
+    if split:
+        _publish_split(obj, publish_path, items_per_page, links_tree, search_index=search_index,
+                       appendix=appendix, bundle=bundle)
+        compress_site(publish_path)
+        log.info("Rendering: %s", renderer.summary())
+        return
+
+    _publish_single(obj, publish_path, links_tree, search_index=search_index,
+                    appendix=appendix, bundle=bundle)
+
+    compress_site(publish_path)
+    log.info("Rendering: %s", renderer.summary())
+
+def _publish_single(obj, publish_path, links_tree=None, sections=None, prefixes=None,
+                    search_index=None, appendix="", bundle=None):
+    """publish all the documents into the index page.
+
+    :param sections: html for each document section by prefix, from the last time the page
+                     was published.  It is updated in place
+    :param prefixes: with sections, the documents to generate again.  The other sections are
+                     reused, None generates them all
+    :param search_index: SearchIndex to add the published items to and write with the page
+    :param appendix: html to add after the documents, like the impact section
+    :param bundle: the stylesheet bundle for the page to link, from css_bundle
+    """
+    renderer = get_renderer()
+    if sections is None:
+        sections = {}
+
+    documents, generated = _render_sections(
+        obj, publish_path, links_tree,
+        lambda prefix: prefixes is None or prefix in prefixes or prefix not in sections,
+        search_index)
+    sections.update(generated)
+    for prefix in list(sections):
+        if prefix not in documents:
+            del sections[prefix]
+
+    body = "".join(sections[prefix] for prefix in documents) + appendix
+
+    if search_index is not None:
+        search_index.retain(documents)
+        search_index.write(publish_path, documents)
+    html = renderer.render_page(body, obj, search=search_index is not None, css_bundle=bundle)
+    _write_page(html, os.path.join(publish_path, INDEX))
+
+def _render_sections(obj, publish_path, links_tree=None, select=None, search_index=None):
+    """generate the html of the document sections of the index page
+
+    :param select: called with each document prefix, only the sections it returns True for
+                   are generated.  None generates them all
+    :param search_index: SearchIndex to add the items of the generated sections to
+
+    :return: the document prefixes in the order they are published, and the html of each
+             generated section by prefix
+    """
+    documents = []
+    sections = {}
+    for obj2, path2 in iter_documents(obj, publish_path, ".html"):
+        documents.append(obj2.prefix)
+        if select is None or select(obj2.prefix):
+            if search_index is not None:
+                search_index.start(obj2.prefix, INDEX)
+            sections[obj2.prefix] = "".join(publish_lines(obj2, ".html", links_tree=links_tree,
+                                                          search_index=search_index))
+    return _ordered_prefixes(documents), sections
+
+def _ordered_prefixes(prefixes):
+    """order the document prefixes the way they are published in the project.
+        Overview first, then requirements and tables, then any other documents"""
+    special_doc_types = [Prefix(doc_type) for doc_type in SPECIAL_DOC_TYPES]
+    ordered = [prefix for prefix in special_doc_types if prefix in prefixes]
+    ordered.extend(prefix for prefix in prefixes if prefix not in special_doc_types)
+    return ordered
+
+def _write_page(html, path):
+    """write out a rendered page"""
+    doorstop.common.write_lines(html.split(os.linesep), path,
+                                end=doorstop.settings.WRITE_LINESEPERATOR)
+
+def _page_name(prefix, page, page_count):
+    """file name for a page of a split document"""
+    if page_count == 1:
+        return "{}.html".format(prefix)
+    return "{}-{}.html".format(prefix, page + 1)
+
+def _split_plan(obj, publish_path, items_per_page=None, links_tree=None):
+    """work out the pages of a split publish first, so links can point at items on other pages
+
+    :return: the documents by prefix, and the prefix, page number, list of pages and file
+             name for each section page
+    """
+    documents = {}
+    for document, _ in iter_documents(obj, publish_path, ".html"):
+        documents[document.prefix] = document
+    overview = Prefix(OVERVIEW_DOCUMENT)
+
+    section_pages = []
+    for prefix in _ordered_prefixes(documents):
+        if prefix == overview:
+            continue
+        items = list(iter_items(documents[prefix]))
+        if not items:
+            continue
+        page_size = items_per_page or len(items)
+        pages = [items[start:start + page_size] for start in range(0, len(items), page_size)]
+        for page, page_items in enumerate(pages):
+            name = _page_name(prefix, page, len(pages))
+            section_pages.append((prefix, page, pages, name))
+            if links_tree is not None:
+                for item in page_items:
+                    links_tree.pages[str(item.uid)] = name
+    if links_tree is not None and overview in documents:
+        for item in iter_items(documents[overview]):
+            links_tree.pages[str(item.uid)] = INDEX
+    return documents, section_pages
+
+def _publish_split(obj, publish_path, items_per_page=None, links_tree=None, only_pages=None,
+                   search_index=None, appendix="", bundle=None):
+    """publish the project as an index page and a page per section.
+        The index holds the overview and the list of sections, the sections are only loaded
+        when the reader opens them, and math is only typeset as it scrolls into view.
+
+    :param only_pages: file names of the section pages to write, the index is always written.
+                       None writes all of them
+    :param search_index: SearchIndex to add the published items to and write with the pages
+    :param appendix: html to add to the index page after the list of sections
+    :param bundle: the stylesheet bundle for the pages to link, from css_bundle
+    """
+    renderer = get_renderer()
+    documents, section_pages = _split_plan(obj, publish_path, items_per_page, links_tree)
+    overview = Prefix(OVERVIEW_DOCUMENT)
+    search = search_index is not None
+
+    index_body = ""
+    if overview in documents:
+        if search:
+            search_index.start(overview, INDEX)
+        for element in publish_lines(documents[overview], ".html", links_tree=links_tree,
+                                     search_index=search_index):
+            index_body += element
+
+    sections = []
+    for prefix, page, pages, name in section_pages:
+        document = documents[prefix]
+        page_items = pages[page]
+
+        if only_pages is None or name in only_pages:
+            gen = get_generator(document, ".html")
+            if search:
+                search_index.start(name, name)
+
+            nav = ['<a href="{}">Index</a>'.format(INDEX)]
+            if page > 0:
+                nav.append('<a href="{}">Previous</a>'.format(
+                    _page_name(prefix, page - 1, len(pages))))
+            if page < len(pages) - 1:
+                nav.append('<a href="{}">Next</a>'.format(
+                    _page_name(prefix, page + 1, len(pages))))
+            body = "<p>{}</p>\n".format(" &bull; ".join(nav))
+            for element in gen(page_items, links_tree=links_tree, search_index=search_index):
+                body += element
+
+            html = renderer.render_page(body, document, lazy_mathjax=True, search=search,
+                                        css_bundle=bundle)
+            _write_page(html, os.path.join(publish_path, name))
+
+        label = str(prefix)
+        if len(pages) > 1:
+            label += " {} - {}".format(page_items[0].uid, page_items[-1].uid)
+        sections.append('<li><a href="{n}">{l}</a> <small>({c} items)</small></li>'.format(
+            n=name, l=label, c=len(page_items)))
+
+    if sections:
+        index_body += "<h3>Sections</h3>\n<ul>\n{}\n</ul>\n".format("\n".join(sections))
+    index_body += appendix
+
+    if search:
+        order = [overview] + [name for _, _, _, name in section_pages]
+        search_index.retain(order)
+        search_index.write(publish_path, order)
+    html = renderer.render_page(index_body, obj, lazy_mathjax=True, search=search,
+                                css_bundle=bundle)
+    _write_page(html, os.path.join(publish_path, INDEX))
+
+def _parent_items(item, links_tree=None):
+    """the items an item links to, resolved against the whole tree when there is a links tree"""
+    if links_tree is not None:
+        return links_tree.parent_items(item)
+    return item.parent_items
+
+def _child_items(item, links_tree=None):
+    """the items that link to an item, with the ones outside the published tree when there
+        is a links tree"""
+    if links_tree is not None:
+        return links_tree.child_items(item)
+    return item.find_child_items()
+
+def _req_lines_markdown(obj, **kwargs):
+    """Yield lines for a Markdown report.
+
+    :param obj: Item, list of Items, or Document to publish
+    :param linkify: turn links into hyperlinks (for conversion to HTML)
+    :param links_tree: LazyTree to resolve the links against the whole tree
+    :param search_index: SearchIndex to add the items to
+
+    :return: iterator of lines of text
+
+    """
+    linkify = kwargs.get("linkify", False)
+    to_html = kwargs.get("to_html", False)
+    links_tree = kwargs.get("links_tree")
+    search_index = kwargs.get("search_index")
+    for item in iter_items(obj):
+        text_lines = item.text.splitlines()
+        if search_index is not None:
+            search_index.add(item, item.document.publish if item.document else None)
+
+        if item.heading:
+            if item.header:
+                text_lines.insert(0, item.header)
+            # Level and Text
+            standard = "- {t}".format(t=text_lines[0] if text_lines else "")
+            attr_list = _format_md_attr_list(item, True)
+            yield ""
+            yield standard + attr_list
+            yield from text_lines[1:]
+        else:
+            uid = item.uid
+            # anchor for resolved links and search results to point at
+            anchor = (' id="{u}"'.format(u=item.uid)
+                      if links_tree is not None or search_index is not None else "")
+            if item.header:
+                uid = "- {h} <small{a}>{u}</small>".format(h=item.header, a=anchor, u=item.uid)
+            else:
+                uid = "- <small{a}>[{u}]</small>".format(a=anchor, u=item.uid)
+
+            # Level and UID
+            standard = "{u}".format(u=uid)
+
+            t = text_lines[0] if text_lines else ""
+
+            attr_list = _format_md_attr_list(item, True)
+            yield standard + " " + t
+            # Text
+            if item.text:
+                yield from text_lines[1:]
+            # Reference
+            if item.ref:
+                yield ""  # break before reference
+                yield _format_md_ref(item)
+            # Reference
+            if item.references:
+                yield ""  # break before reference
+                yield _format_md_references(item)
+            # Parent links
+            if item.links:
+                yield ""  # break before links
+                items2 = _parent_items(item, links_tree)
+                label = "Parent links:"
+                links = _format_md_links(items2, linkify, to_html=to_html, links_tree=links_tree)
+                label_links = _format_md_label_links(label, links, linkify)
+                yield label_links
+            # Child links
+            items2 = _child_items(item, links_tree)
+            if items2:
+                yield ""  # break before links
+                label = "Child links:"
+                links = _format_md_links(items2, linkify, to_html=to_html, links_tree=links_tree)
+                label_links = _format_md_label_links(label, links, linkify)
+                yield label_links
+            # Add custom publish attributes
+            if item.document and item.document.publish:
+                header_printed = False
+                for attr in item.document.publish:
+                    if not item.attribute(attr):
+                        continue
+                    if not header_printed:
+                        header_printed = True
+                        yield ""
+                        yield "| Attribute | Value |"
+                        yield "| --------- | ----- |"
+                    yield "| {} | {} |".format(attr, item.attribute(attr))
+                yield ""
+
+def _ovr_lines_markdown(obj, **kwargs):
+    """Yield lines for a Markdown report.
+
+    :param obj: Item, list of Items, or Document to publish
+    :param linkify: turn links into hyperlinks (for conversion to HTML)
+    :param links_tree: LazyTree to resolve the links against the whole tree
+    :param search_index: SearchIndex to add the items to
+
+    :return: iterator of lines of text
+
+    """
+    linkify = kwargs.get("linkify", False)
+    to_html = kwargs.get("to_html", False)
+    links_tree = kwargs.get("links_tree")
+    search_index = kwargs.get("search_index")
+    for item in iter_items(obj):
+        text_lines = item.text.splitlines()
+        if search_index is not None:
+            search_index.add(item, item.document.publish if item.document else None)
+        if item.header:
+            yield ""
+            if links_tree is not None or search_index is not None:
+                yield f"##### {item.header} {{#{item.uid}}}"
+            else:
+                yield f"##### {item.header}"
+            yield ""
+        # Text
+        if item.text:
+            yield from text_lines[0:]
+        # Reference
+        if item.ref:
+            yield ""  # break before reference
+            yield _format_md_ref(item)
+        # Reference
+        if item.references:
+            yield ""  # break before reference
+            yield _format_md_references(item)
+        # Parent links
+        if item.links:
+            yield ""  # break before links
+            items2 = _parent_items(item, links_tree)
+            label = "Parent links:"
+            links = _format_md_links(items2, linkify, to_html=to_html, links_tree=links_tree)
+            label_links = _format_md_label_links(label, links, linkify)
+            yield label_links
+        # Child links
+        items2 = _child_items(item, links_tree)
+        if items2:
+            yield ""  # break before links
+            label = "Child links:"
+            links = _format_md_links(items2, linkify, to_html=to_html, links_tree=links_tree)
+            label_links = _format_md_label_links(label, links, linkify)
+            yield label_links
+        # Add custom publish attributes
+        if item.document and item.document.publish:
+            header_printed = False
+            for attr in item.document.publish:
+                if not item.attribute(attr):
+                    continue
+                if not header_printed:
+                    header_printed = True
+                    yield ""
+                    yield "| Attribute | Value |"
+                    yield "| --------- | ----- |"
+                yield "| {} | {} |".format(attr, item.attribute(attr))
+            yield ""
+
+def _lines_overview(obj, **kwargs):
+    text = "\n".join(_ovr_lines_markdown(obj, linkify=False, to_html=True, **kwargs))
+    if len(text) > 0:
+        text = "### Overview\n" + text
+    body = get_renderer().markdown(text)
+
+    yield body
+
+def _lines_requirements(obj, **kwargs):
+    text = "\n".join(_req_lines_markdown(obj, linkify=False, to_html=True, **kwargs))
+    if len(text) > 0:
+        text = "### Requirements Changes\n" + text
+    body = get_renderer().markdown(text)
+    yield body
+
+def _lines_tables(obj, **kwargs):
+    # the tables are written straight to html rather than through a markdown table
+    with get_renderer().converter() as converter:
+        body = "\n".join(_tab_lines_html_table(obj, linkify=False, to_html=True,
+                                                converter=converter, **kwargs))
+    if len(body) > 0:
+        body = "<h3>Table Changes</h3>\n" + body
+    yield body
+
+PUBLISH_GENERATORS = {
+    "REQ" : _lines_requirements,
+    "OVR" : _lines_overview,
+    "TAB" : _lines_tables,
+}
+
+def get_generator(obj, ext):
+    """find the lines generator for the obj type"""
+    if is_document(obj):
+        doc_name = "{}".format(obj.prefix)
+    elif is_item(obj):
+        doc_name = "{}".format(obj.document.prefix)
+
+    doc_types = ", ".join(doc for doc in PUBLISH_GENERATORS)
+    msg = "Unknown document type: {} (options: {})".format(doc_name, doc_types)
+    #exc = doorstop.DoorstopError(msg)
+
+    try:
+        gen = PUBLISH_GENERATORS[doc_name]
+    except KeyError:
+        log.error(msg)
+        gen = PUBLISH_GENERATORS["REQ"]
+    return gen
+
+def publish_lines(obj, ext='.txt', **kwargs):
+    """method to return the lines for various document types"""
+    gen = get_generator(obj, ext)
+    yield from gen(obj, **kwargs)
+
+# tree = doorstop.build()
 # publish_project(tree, 'ProjA', 'public')
\ No newline at end of file
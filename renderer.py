@@ -0,0 +1,119 @@
+"""
+    Rendering context shared by all the publishers.
+    Building a markdown converter loads all of its extensions, so the converters are kept in
+    a pool and reused.  The page template is compiled once per process here too, and the views
+    folder is only added to bottle's search path once.
+"""
+import contextlib
+import os
+import time
+import bottle
+import doorstop
+import markdown
+
+from common import logger
+
+log = logger(__name__)
+
+VIEWS_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), "views")
+
+_RENDERERS = {}
+
+
+class Renderer:
+    """Holds the compiled page template and a pool of markdown converters.
+        Use get_renderer() rather than creating these directly so there is one per process.
+
+    :param template: name of the page template in the views folder
+    :param extensions: markdown extensions for the converters
+    """
+    def __init__(self, template=None, extensions=None):
+        self.template_name = template or doorstop.publisher.HTMLTEMPLATE
+        self.extensions = extensions or doorstop.publisher.EXTENSIONS
+        self._pool = []
+        self.stats = {
+            "templates_compiled": 0,
+            "pages_rendered": 0,
+            "converters_created": 0,
+            "converters_reused": 0,
+            "template_seconds": 0.0,
+            "converter_seconds": 0.0,
+        }
+
+        start = time.perf_counter()
+        # only add the views once, so the search path doesn't grow with every renderer
+        if VIEWS_PATH not in bottle.TEMPLATE_PATH:
+            bottle.TEMPLATE_PATH.insert(0, VIEWS_PATH)
+        if "baseurl" not in bottle.SimpleTemplate.defaults:
+            bottle.SimpleTemplate.defaults["baseurl"] = ""
+        try:
+            self._template = bottle.SimpleTemplate(name=self.template_name, lookup=[VIEWS_PATH])
+            # compile now rather than on the first page
+            self._template.co  # pylint: disable=pointless-statement
+        except Exception:
+            log.error("Problem parsing the template %s", self.template_name)
+            raise
+        self.stats["templates_compiled"] += 1
+        self.stats["template_seconds"] += time.perf_counter() - start
+
+    def render_page(self, body, document, toc="", **kwargs):
+        """fill in the page template
+
+        :param body: html for the main part of the page
+        :param document: the document or tree the page is for, None for a page merged from
+                         fragments
+        :param toc: html for the table of contents
+        :param css_bundle: the stylesheet bundle sync_assets wrote, the page links it instead
+                           of the separate stylesheets
+        """
+        self.stats["pages_rendered"] += 1
+        try:
+            parent = document.parent if document is not None else None
+            return self._template.render(body=body, toc=toc, parent=parent,
+                                         document=document, **kwargs)
+        except Exception:
+            log.error("Problem parsing the template %s", self.template_name)
+            raise
+
+    @contextlib.contextmanager
+    def converter(self):
+        """borrow a markdown converter from the pool, it is reset and ready to use"""
+        if self._pool:
+            converter = self._pool.pop()
+            converter.reset()
+            self.stats["converters_reused"] += 1
+        else:
+            start = time.perf_counter()
+            converter = markdown.Markdown(extensions=self.extensions)
+            self.stats["converters_created"] += 1
+            self.stats["converter_seconds"] += time.perf_counter() - start
+        try:
+            yield converter
+        finally:
+            self._pool.append(converter)
+
+    def markdown(self, text):
+        """convert markdown text to html"""
+        with self.converter() as converter:
+            return converter.convert(text)
+
+    def summary(self):
+        """describe the setup work done, and an estimate of the converter setup that reuse
+            saved.  bottle caches compiled templates too, so the template isn't counted."""
+        stats = self.stats
+        saved = stats["converters_reused"] * (
+            stats["converter_seconds"] / max(stats["converters_created"], 1))
+        return ("{c} converters created in {cs:.3f}s and reused {cr} times, saving about "
+                "{saved:.3f}s, template compiled in {ts:.3f}s and used for {p} pages").format(
+                    c=stats["converters_created"], cs=stats["converter_seconds"],
+                    cr=stats["converters_reused"], ts=stats["template_seconds"],
+                    p=stats["pages_rendered"], saved=saved)
+
+
+def get_renderer(template=None, extensions=None):
+    """the renderer for this process, created on first use"""
+    key = (template or doorstop.publisher.HTMLTEMPLATE,
+           tuple(extensions or doorstop.publisher.EXTENSIONS))
+    if key not in _RENDERERS:
+        _RENDERERS[key] = Renderer(template, extensions)
+    return _RENDERERS[key]
@@ -0,0 +1,143 @@
+"""
+    Search index for the published project pages.
+    The generators add each item to the index as they publish it, the UID, header, text and
+    published attributes are split into terms.  The index is written as static JSON next to
+    the pages: a list of the items, and the postings of each term in shards by the first
+    character of the term, so the search box only loads the shards for the terms typed in.
+"""
+import json
+import os
+import re
+
+from common import logger
+
+log = logger(__name__)
+
+SEARCH_FOLDER = "search"
+ITEMS_FILE = "items.json"
+TERMS_FILE = "terms-{}.json"
+INDEX_VERSION = 1
+# the decorations of the removed and added lines, and html entities
+MARKUP = re.compile(r"<[^>]*>|&[#\w]+;")
+TERM = re.compile(r"\w+")
+MIN_TERM_LENGTH = 2
+# shard for the terms that don't start with an ascii letter or digit
+OTHER_SHARD = "_"
+
+
+def _terms(*values):
+    """the distinct search terms in the values"""
+    terms = set()
+    for value in values:
+        if value is None or value == "":
+            continue
+        text = MARKUP.sub(" ", str(value)).lower()
+        terms.update(term for term in TERM.findall(text) if len(term) >= MIN_TERM_LENGTH)
+    return terms
+
+
+def _shard(term):
+    """the shard a term is kept in, search.js has to use the same rule"""
+    first = term[0]
+    if first.isascii() and first.isalnum():
+        return first
+    return OTHER_SHARD
+
+
+class SearchIndex:
+    """the items on the published pages and their search terms.
+        Items are kept by section, so a section that isn't published again keeps its items
+        when the index is written again.
+    """
+    def __init__(self):
+        self.sections = {}
+        self._section = None
+        self._page = None
+
+    def start(self, section, page):
+        """start collecting the items of a section again
+
+        :param section: the document prefix, or page name for a split document
+        :param page: the page the section is published on
+        """
+        self._section = str(section)
+        self._page = page
+        self.sections[self._section] = []
+
+    def add(self, item, attributes=None):
+        """add an item the generator is publishing to the current section
+
+        :param item: the item
+        :param attributes: names of other attributes to search, like the table columns
+        """
+        if self._section is None:
+            return
+        values = [item.uid, item.header, item.text]
+        values.extend(item.attribute(attr) for attr in attributes or [])
+        self.sections[self._section].append(
+            (str(item.uid), item.header or "", str(item.document.prefix), self._page,
+             _terms(*values)))
+
+    def retain(self, sections):
+        """forget the sections that aren't published any more"""
+        keep = {str(section) for section in sections}
+        for section in list(self.sections):
+            if section not in keep:
+                del self.sections[section]
+
+    def export(self, section):
+        """the items of a section, to be loaded into another index"""
+        return [[uid, header, prefix, page, sorted(terms)]
+                for uid, header, prefix, page, terms in self.sections.get(str(section), [])]
+
+    def load(self, section, entries):
+        """load the items of a section exported from another index"""
+        self.sections[str(section)] = [(uid, header, prefix, page, set(terms))
+                                       for uid, header, prefix, page, terms in entries]
+
+    def write(self, publish_path, order=None):
+        """write the index into the search folder of the publish path
+
+        :param order: the sections in the order they are published, defaults to the order
+                      they were added
+
+        :return: the number of items and terms written
+        """
+        items = []
+        postings = {}
+        for section in order or list(self.sections):
+            for uid, header, prefix, page, terms in self.sections.get(str(section), []):
+                number = len(items)
+                items.append([uid, header, prefix, page])
+                for term in terms:
+                    postings.setdefault(term, []).append(number)
+
+        shards = {}
+        for term in sorted(postings):
+            shards.setdefault(_shard(term), {})[term] = postings[term]
+
+        search_path = os.path.join(publish_path, SEARCH_FOLDER)
+        os.makedirs(search_path, exist_ok=True)
+        _write_json(os.path.join(search_path, ITEMS_FILE),
+                    {"version": INDEX_VERSION, "items": items, "shards": sorted(shards)})
+        names = set()
+        for key, terms in shards.items():
+            names.add(TERMS_FILE.format(key))
+            _write_json(os.path.join(search_path, TERMS_FILE.format(key)), terms)
+        # shards with no terms left in them, compress_site removes their compressed copies
+        prefix, suffix = TERMS_FILE.split("{}")
+        for name in os.listdir(search_path):
+            if name.startswith(prefix) and name.endswith(suffix) and name not in names:
+                os.remove(os.path.join(search_path, name))
+
+        log.info("Search index of %d items and %d terms in %d shards", len(items),
+                 len(postings), len(shards))
+        return len(items), len(postings)
+
+
+def _write_json(path, data):
+    """write compact json, by replacing the file so it isn't changed under a reader"""
+    temp_file = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_file, "w", encoding="utf-8") as stream:
+        json.dump(data, stream, separators=(",", ":"), ensure_ascii=False)
+    os.replace(temp_file, path)
@@ -0,0 +1,212 @@
+"""Serve published folders for review.
+    The compressed copies written at publish time are sent when the browser accepts them, with
+    strong ETags from the content hashes, so a page that hasn't changed is answered with
+    304 Not Modified on a reload.
+
+    python serve.py project_ProjA/public --port 8080
+"""
+import argparse
+import hashlib
+import mimetypes
+import os
+import bottle
+
+from common import logger, configure_logging
+from process_diff import PUBLISH_FOLDER
+from publish_compress import CONTENT_MANIFEST, ENCODINGS, variant_path, load_content_manifest
+from publish_assets import ASSETS, ASSET_MANIFEST
+
+log = logger(__name__)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+INDEX = "index.html"
+# the browser has to check with the server, which is cheap with the ETags
+CACHE_CONTROL = "no-cache"
+# build metadata written with the site, it isn't served with dotfiles like the release marker
+PRIVATE_FILES = (CONTENT_MANIFEST, ASSETS + "/" + ASSET_MANIFEST)
+
+
+def _is_private(rel_path):
+    """if a path in the site is a dotfile or build metadata, or a compressed copy of one"""
+    if any(part.startswith(".") for part in rel_path.split("/")):
+        return True
+    for suffix in ENCODINGS.values():
+        if rel_path.endswith(suffix):
+            rel_path = rel_path[:-len(suffix)]
+            break
+    return rel_path in PRIVATE_FILES
+
+
+class PublishedSite:
+    """a published folder and the content hashes of its files.
+        The hashes are read again when the folder is published again.
+
+    :param folder: the publish folder, it can be the link publish_site swaps
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self._key = None
+        self._files = {}
+        self._hashed = {}
+
+    def _load(self):
+        """read the content manifest if the folder changed"""
+        root = os.path.realpath(self.folder)
+        try:
+            mtime = os.stat(os.path.join(root, CONTENT_MANIFEST)).st_mtime
+        except OSError:
+            mtime = None
+        if (root, mtime) != self._key:
+            self._key = (root, mtime)
+            self._files = load_content_manifest(root)
+            self._hashed = {}
+        return root
+
+    def find(self, rel_path):
+        """the file for a request path and its manifest entry
+
+        :return: file path and entry, or None if there is no such file in the folder, or it
+                 isn't served
+        """
+        root = self._load()
+        path = os.path.realpath(os.path.join(root, rel_path))
+        if path != root and not path.startswith(root + os.sep):
+            return None
+        if os.path.isdir(path):
+            path = os.path.join(path, INDEX)
+        if not os.path.isfile(path):
+            return None
+        rel_path = os.path.relpath(path, root).replace("\\", "/")
+        if _is_private(rel_path):
+            return None
+
+        stat = os.stat(path)
+        entry = self._files.get(rel_path)
+        if entry is None or entry.get("size") != stat.st_size or \
+                entry.get("mtime") != stat.st_mtime:
+            # not published through compress_site, hash it here once
+            key = (rel_path, stat.st_size, stat.st_mtime)
+            if key not in self._hashed:
+                with open(path, "rb") as stream:
+                    digest = hashlib.sha256(stream.read()).hexdigest()
+                self._hashed[key] = {"sha256": digest, "encodings": []}
+            entry = self._hashed[key]
+        return path, entry
+
+
+def _accepted_encodings(header):
+    """the encodings in an Accept-Encoding header that aren't refused"""
+    accepted = set()
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    return accepted
+
+
+def _etag_matches(header, etag):
+    """check an If-None-Match header against the ETag, with the weak comparison it uses"""
+    if header.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in header.split(",")]
+    return etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def _send(site, rel_path):
+    """the response for a file in a site"""
+    found = site.find(rel_path)
+    if found is None:
+        return bottle.HTTPError(404, "Not found")
+    path, entry = found
+
+    accepted = _accepted_encodings(bottle.request.headers.get("Accept-Encoding", ""))
+    encoding = None
+    for name in ENCODINGS:
+        if name in entry.get("encodings", []) and name in accepted:
+            encoding = name
+            break
+
+    # each encoding is a different representation, so it gets its own strong ETag
+    etag = '"{}"'.format(entry["sha256"] + ("-" + encoding if encoding else ""))
+    content_type, _ = mimetypes.guess_type(path)
+    content_type = content_type or "application/octet-stream"
+    if content_type.startswith("text/") or content_type in ("application/javascript",
+                                                            "application/json"):
+        content_type += "; charset=utf-8"
+    headers = {
+        "ETag": etag,
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept-Encoding",
+        "Content-Type": content_type,
+    }
+
+    if _etag_matches(bottle.request.headers.get("If-None-Match", ""), etag):
+        return bottle.HTTPResponse(status=304, **headers)
+
+    if encoding:
+        path = variant_path(path, encoding)
+        headers["Content-Encoding"] = encoding
+    headers["Content-Length"] = str(os.path.getsize(path))
+    return bottle.HTTPResponse(open(path, "rb"), **headers)
+
+
+def _site_name(folder):
+    """name to serve a folder under, the branch folder for a publish folder"""
+    path = os.path.normpath(os.path.abspath(folder))
+    if os.path.basename(path) == PUBLISH_FOLDER:
+        path = os.path.dirname(path)
+    return os.path.basename(path)
+
+
+def make_app(folders):
+    """the bottle app serving the folders.
+        One folder is served at the root, more are served under their folder names.
+    """
+    app = bottle.Bottle()
+    if len(folders) == 1:
+        sites = {"": PublishedSite(folders[0])}
+    else:
+        sites = {_site_name(folder): PublishedSite(folder) for folder in folders}
+
+    @app.get("/")
+    @app.get("/<path:path>")
+    def serve(path=""):
+        if "" in sites:
+            return _send(sites[""], path)
+        name, _, rel_path = path.partition("/")
+        if name in sites:
+            if not rel_path and not path.endswith("/"):
+                bottle.redirect("/{}/".format(name))
+            return _send(sites[name], rel_path)
+        if not path:
+            links = "".join('<li><a href="/{0}/">{0}</a></li>'.format(name)
+                            for name in sorted(sites))
+            return "<html><body><ul>{}</ul></body></html>".format(links)
+        return bottle.HTTPError(404, "Not found")
+
+    return app
+
+
+def main(args=None):
+    """serve the published folders"""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folders", nargs="+", help="Published folders to serve")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--log-file", dest="log_file", default=None,
+                        help="Log everything to this file")
+    args = parser.parse_args(args=args)
+    configure_logging(args.log_file)
+
+    bottle.run(make_app(args.folders), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
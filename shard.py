@@ -0,0 +1,444 @@
+"""
+    Sharded publishing, to spread the processing and rendering of a big diff over processes
+    or nodes.  The changed files of the diff are split into stable shards, by document prefix
+    or by a hash of the file path.  All the shards work in one shared folder:
+
+    1. the plan reads the diff once, writes the diff lines of each shard's files to a patch
+       of its own, and copies the document configs into the shared items folder
+    2. each shard processes only its patch into the items folder, and writes a marker with
+       the documents it wrote
+    3. once every shard is done, each shard loads the tree of all the changed documents, so
+       links between items on different shards are the same as a normal run, and generates
+       the sections of the documents it owns into a fragment bundle
+    4. the merge puts the sections together into index.html in the order publish_project
+       uses
+
+    Every shard still loads the whole changed tree, only the processing and the rendering are
+    split.  A shard that fails writes a failed marker, and the shards waiting on it stop.
+
+    python shard.py plan master project/ProjA --shards 4 --dir /shared/ProjA
+    python shard.py run --shard 0 --dir /shared/ProjA
+    python shard.py merge --dir /shared/ProjA --output project_ProjA/public
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import zlib
+import doorstop
+
+from common import logger, configure_logging
+from vcs_common import (_check_active_branch, _merge_base, _rev_parse, _git_output, _split_diff,
+                        _parse_file_diff)
+from process_diff import _process_patched_file, _build_tree, _item_format
+from change_manifest import _document_prefix
+from publish_project import _render_sections, _write_page, INDEX
+from publish_assets import sync_assets, css_bundle
+from publish_compress import compress_site
+from renderer import get_renderer
+from link_index import LinkIndex, LazyTree, DEFAULT_CACHE_DIR
+from search_index import SearchIndex
+from impact import LinkGraph, publish_impact, changed_uids
+
+log = logger(__name__)
+
+SHARD_BY_PREFIX = "prefix"
+SHARD_BY_PATH = "path"
+SHARD_KEYS = (SHARD_BY_PREFIX, SHARD_BY_PATH)
+ITEMS_FOLDER = "items"
+PLAN = "plan.json"
+PATCH = "diff-{}.patch"
+MARKER = "shard-{}.json"
+FAILED = "failed-{}.json"
+FRAGMENT = "fragment-{}.json"
+DOC_CONFIG = ".doorstop.yml"
+# seconds a shard waits for the others to finish processing
+DEFAULT_TIMEOUT = 3600.0
+POLL_INTERVAL = 0.2
+SHARD_SCRIPT = os.path.realpath(__file__)
+
+
+def shard_index(key, shards):
+    """the shard for a document prefix or file path.
+        crc32 is used rather than hash() so every process and node gets the same shard."""
+    return zlib.crc32(str(key).encode("utf-8")) % shards
+
+
+def _file_shard(file_path, shards, key):
+    """the shard that processes a changed file"""
+    if key == SHARD_BY_PATH:
+        return shard_index(file_path, shards)
+    return shard_index(_document_prefix(os.path.dirname(file_path)), shards)
+
+
+def _write_json(path, data):
+    """write a marker or fragment in one step, other shards poll for them"""
+    temp_file = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_file, "w", encoding="utf-8") as stream:
+        json.dump(data, stream)
+    os.replace(temp_file, path)
+
+
+def _read_json(path):
+    with open(path, "r", encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def mark_failed(shard_dir, shard, reason):
+    """record that a shard failed, so the shards waiting on it stop"""
+    _write_json(os.path.join(shard_dir, FAILED.format(shard)),
+                {"shard": shard, "reason": str(reason)})
+
+
+def _check_failed(shard_dir, shards):
+    """stop when any shard has failed"""
+    for shard in range(shards):
+        path = os.path.join(shard_dir, FAILED.format(shard))
+        if os.path.isfile(path):
+            raise doorstop.DoorstopError("Shard {} failed: {}".format(
+                shard, _read_json(path)["reason"]))
+
+
+def _wait_for_markers(shard_dir, shards, timeout=None):
+    """wait until every shard has processed its files, or one of them failed
+
+    :return: the markers in shard order
+    """
+    timeout = DEFAULT_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    paths = [os.path.join(shard_dir, MARKER.format(shard)) for shard in range(shards)]
+    while True:
+        _check_failed(shard_dir, shards)
+        missing = [path for path in paths if not os.path.isfile(path)]
+        if not missing:
+            return [_read_json(path) for path in paths]
+        if time.monotonic() > deadline:
+            raise doorstop.DoorstopError("Timed out waiting for {}".format(", ".join(missing)))
+        time.sleep(POLL_INTERVAL)
+
+
+def _check_same(records, fields, what):
+    """all the shards have to have worked on the same thing"""
+    for field in fields:
+        values = {json.dumps(record[field]) for record in records}
+        if len(values) > 1:
+            raise doorstop.DoorstopError("The {} don't match on {}: {}".format(
+                what, field, sorted(values)))
+
+
+def _copy_document_configs(doc_path, items_path):
+    """copy the config of a document, and of the documents above it, into the items folder"""
+    while doc_path:
+        dest = os.path.join(items_path, doc_path, DOC_CONFIG)
+        config = os.path.join(doc_path, DOC_CONFIG)
+        if os.path.isfile(config) and not os.path.isfile(dest):
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy(config, dest)
+        doc_path = os.path.dirname(doc_path)
+
+
+def plan_shards(main_branch, project_branch, shards, shard_dir, key=SHARD_BY_PREFIX,
+                after_only=False):
+    """read the diff once and split its files into a patch for each shard.  The document
+        configs are copied into the items folder here, before any shard starts, so the
+        shards don't write them at the same time.
+
+    :return: the plan
+    """
+    items_path = os.path.join(shard_dir, ITEMS_FOLDER)
+    os.makedirs(items_path, exist_ok=True)
+    main_commit = _rev_parse(main_branch)
+    project_commit = _rev_parse(project_branch)
+    base_commit = _merge_base(main_commit, project_commit)
+
+    # the position in the diff of each file, so the document list is put back in the order
+    # a single run has it
+    files = [[] for _ in range(shards)]
+    patches = [[] for _ in range(shards)]
+    diff = _git_output("diff", "--no-prefix", "-U10000", base_commit, project_commit)
+    for position, (path, lines) in enumerate(_split_diff(diff)):
+        shard = _file_shard(path, shards, key)
+        files[shard].append([position, path])
+        patches[shard].extend(lines)
+        if _item_format(path) is not None:
+            _copy_document_configs(os.path.dirname(path), items_path)
+    for shard in range(shards):
+        with open(os.path.join(shard_dir, PATCH.format(shard)), "wb") as stream:
+            stream.write(b"".join(patches[shard]))
+
+    plan = {
+        "shards": shards,
+        "key": key,
+        "after_only": after_only,
+        "main": main_commit,
+        "project": project_commit,
+        "base": base_commit,
+        "files": files,
+    }
+    _write_json(os.path.join(shard_dir, PLAN), plan)
+    log.info("Planned %d files in %d shards", sum(len(paths) for paths in files), shards)
+    return plan
+
+
+def _read_plan(shard_dir):
+    """the plan the shards were split by"""
+    path = os.path.join(shard_dir, PLAN)
+    if not os.path.isfile(path):
+        raise doorstop.DoorstopError("There is no {} in {}, plan the shards first".format(
+            PLAN, shard_dir))
+    return _read_json(path)
+
+
+def process_shard(shard, shard_dir):
+    """process the patch of one shard into the shared items folder
+
+    :return: the marker written for the shard
+    """
+    plan = _read_plan(shard_dir)
+    items_path = os.path.join(shard_dir, ITEMS_FOLDER)
+    with open(os.path.join(shard_dir, PATCH.format(shard)), "rb") as stream:
+        patched_files = list(_parse_file_diff([stream.read()]))
+
+    documents = {}
+    for (position, _), patched_file in zip(plan["files"][shard], patched_files):
+        doc_list = []
+        if _process_patched_file(patched_file, items_path, doc_list, plan["after_only"]):
+            documents.setdefault(doc_list[0], position)
+    log.info("Shard %d of %d processed %d files", shard, plan["shards"], len(patched_files))
+
+    marker = {
+        "shard": shard,
+        "shards": plan["shards"],
+        "project": plan["project"],
+        "base": plan["base"],
+        "documents": [[position, doc_path] for doc_path, position in documents.items()],
+    }
+    _write_json(os.path.join(shard_dir, MARKER.format(shard)), marker)
+    return marker
+
+
+def render_shard(shard, shard_dir, link_index=None, timeout=None, search=False):
+    """generate the sections of the documents of one shard once every shard has processed
+        its files
+
+    :param search: add the search index entries of the sections to the fragment
+
+    :return: the fragment written for the shard
+    """
+    shards = _read_plan(shard_dir)["shards"]
+    markers = _wait_for_markers(shard_dir, shards, timeout)
+    _check_same(markers, ["shards", "project", "base"], "shard markers")
+
+    positions = {}
+    for marker in markers:
+        for position, doc_path in marker["documents"]:
+            positions[doc_path] = min(position, positions.get(doc_path, position))
+    doc_list = sorted(positions, key=positions.get)
+
+    documents = []
+    sections = {}
+    changed = []
+    search_index = SearchIndex() if search else None
+    if doc_list:
+        tree = _build_tree(os.path.join(shard_dir, ITEMS_FOLDER), doc_list)
+        links_tree = LazyTree(tree, link_index) if link_index is not None else None
+        documents, sections = _render_sections(
+            tree, os.path.join(shard_dir, ITEMS_FOLDER), links_tree,
+            lambda prefix: shard_index(prefix, shards) == shard, search_index)
+        # the changed items of the documents this shard owns, for the impact analysis
+        changed = [uid for document in tree if document.prefix in sections
+                   for uid in changed_uids([document])]
+    log.info("Shard %d of %d generated %s", shard, shards, list(sections))
+
+    fragment = {
+        "shard": shard,
+        "shards": shards,
+        "project": markers[0]["project"],
+        "base": markers[0]["base"],
+        "documents": [str(prefix) for prefix in documents],
+        "sections": {str(prefix): html for prefix, html in sections.items()},
+        "changed": changed,
+        "search": ({str(prefix): search_index.export(prefix) for prefix in sections}
+                   if search else None),
+    }
+    _write_json(os.path.join(shard_dir, FRAGMENT.format(shard)), fragment)
+    return fragment
+
+
+def merge_fragments(shard_dir, publish_path, asset_store=None, impact=False, cache_dir=None):
+    """put the fragment bundles of all the shards together into the index page
+
+    :param shard_dir: the shared folder of the shards
+    :param publish_path: folder to publish the page to
+    :param asset_store: optional shared asset store to hardlink the html assets from
+    :param impact: add the section of the items downstream of the changed items
+    :param cache_dir: folder for the cached link graph, defaults to one in the shared folder
+    """
+    first = _read_json(os.path.join(shard_dir, FRAGMENT.format(0)))
+    fragments = [first]
+    for shard in range(1, first["shards"]):
+        path = os.path.join(shard_dir, FRAGMENT.format(shard))
+        if not os.path.isfile(path):
+            raise doorstop.DoorstopError("Missing the fragment of shard {}".format(shard))
+        fragments.append(_read_json(path))
+    _check_same(fragments, ["shards", "project", "base", "documents"], "fragments")
+    search = all(fragment.get("search") is not None for fragment in fragments)
+
+    sections = {}
+    for fragment in fragments:
+        for prefix, html in fragment["sections"].items():
+            if prefix in sections:
+                raise doorstop.DoorstopError("{} was generated by more than one shard".format(
+                    prefix))
+            sections[prefix] = html
+    missing = [prefix for prefix in first["documents"] if prefix not in sections]
+    if missing:
+        raise doorstop.DoorstopError("No shard generated {}".format(", ".join(missing)))
+
+    # the documents were put in the publish order by the shards
+    body = "".join(sections[prefix] for prefix in first["documents"])
+    renderer = get_renderer()
+    os.makedirs(publish_path, exist_ok=True)
+    if impact:
+        changed = [uid for fragment in fragments for uid in fragment["changed"]]
+        link_graph = LinkGraph(first["project"],
+                               cache_dir or os.path.join(shard_dir, DEFAULT_CACHE_DIR),
+                               first["base"])
+        body += publish_impact(link_graph, changed, publish_path)
+    if search:
+        search_index = SearchIndex()
+        for fragment in fragments:
+            for prefix, entries in fragment["search"].items():
+                search_index.load(prefix, entries)
+        search_index.write(publish_path, first["documents"])
+    bundle = css_bundle(sync_assets(publish_path, store=asset_store))
+    _write_page(renderer.render_page(body, None, search=search, css_bundle=bundle),
+                os.path.join(publish_path, INDEX))
+    compress_site(publish_path)
+    log.info("Merged %d shards into %s", len(fragments), publish_path)
+
+
+def run_shards(main_branch, project_branch, shards, shard_dir, publish_path, key=SHARD_BY_PREFIX,
+               after_only=False, resolve_links=False, cache_dir=None, asset_store=None,
+               search=False, impact=False):
+    """plan the shards, run each one in a local process of its own standing in for the nodes,
+        then merge.  The first shard that fails stops the others.
+
+    :param cache_dir: folder for the cached link index and graph, defaults to one in the
+                      shared folder
+
+    :return: the publish folder
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    cache_dir = cache_dir or os.path.join(shard_dir, DEFAULT_CACHE_DIR)
+    plan_shards(main_branch, project_branch, shards, shard_dir, key, after_only)
+    command = [sys.executable, SHARD_SCRIPT, "run", "--dir", shard_dir]
+    if resolve_links:
+        LinkIndex(project_branch, cache_dir, LinkGraph(project_branch, cache_dir)).prepare()
+        command.extend(["--resolve-links", "--cache-dir", cache_dir])
+    if search:
+        command.append("--search")
+
+    running = {shard: subprocess.Popen(command + ["--shard", str(shard)])  # pylint: disable=R1732
+               for shard in range(shards)}
+    failed = []
+    while running and not failed:
+        for shard, process in list(running.items()):
+            if process.poll() is None:
+                continue
+            del running[shard]
+            if process.returncode:
+                failed.append(shard)
+                if not os.path.isfile(os.path.join(shard_dir, FAILED.format(shard))):
+                    mark_failed(shard_dir, shard, "exit code {}".format(process.returncode))
+        if running and not failed:
+            time.sleep(POLL_INTERVAL)
+    for process in running.values():
+        process.kill()
+        process.wait()
+    if failed:
+        log.fatal("Shard %s failed, stopped the other shards", failed)
+        sys.exit(1)
+
+    merge_fragments(shard_dir, publish_path, asset_store, impact, cache_dir)
+    return publish_path
+
+
+def main(args=None):
+    """run one shard, or merge the shards"""
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--log-file", dest="log_file", default=None,
+                        help="Log everything to this file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan = commands.add_parser("plan", help="Split the diff into a patch for each shard")
+    plan.add_argument("main", help="Main branch")
+    plan.add_argument("project", help="Project branch")
+    plan.add_argument("--shards", type=int, required=True, help="Number of shards")
+    plan.add_argument("--dir", dest="shard_dir", required=True,
+                      help="Folder shared by the shards, use a new one for each run")
+    plan.add_argument("--key", choices=SHARD_KEYS, default=SHARD_BY_PREFIX,
+                      help="Split the changed files by document prefix or by file path")
+    plan.add_argument("--after-only", dest="after_only", action="store_true")
+
+    run = commands.add_parser("run", help="Process and generate one shard")
+    run.add_argument("--shard", type=int, required=True, help="This shard, from 0")
+    run.add_argument("--dir", dest="shard_dir", required=True,
+                     help="Folder shared by the shards, with the plan in it")
+    run.add_argument("--resolve-links", dest="resolve_links", action="store_true")
+    run.add_argument("--cache-dir", dest="cache_dir", default=None,
+                     help="defaults to {} in the shared folder".format(DEFAULT_CACHE_DIR))
+    run.add_argument("--search", action="store_true",
+                     help="Add the search index of the sections to the fragment")
+    run.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT,
+                     help="Seconds to wait for the other shards")
+
+    merge = commands.add_parser("merge", help="Merge the shards into the index page")
+    merge.add_argument("--dir", dest="shard_dir", required=True,
+                       help="Folder shared by the shards")
+    merge.add_argument("--output", required=True, help="Folder to publish to")
+    merge.add_argument("--asset-store", dest="asset_store", default=None)
+    merge.add_argument("--impact", action="store_true",
+                       help="Add the items downstream of the changed items")
+    merge.add_argument("--cache-dir", dest="cache_dir", default=None,
+                       help="defaults to {} in the shared folder".format(DEFAULT_CACHE_DIR))
+
+    args = parser.parse_args(args=args)
+    configure_logging(args.log_file)
+    if args.command != "plan":
+        args.cache_dir = args.cache_dir or os.path.join(args.shard_dir, DEFAULT_CACHE_DIR)
+
+    if args.command == "merge":
+        merge_fragments(args.shard_dir, args.output, args.asset_store, args.impact,
+                        args.cache_dir)
+        return
+
+    if args.command == "plan":
+        if args.shards < 1:
+            parser.error("--shards has to be at least 1")
+        _check_active_branch(args.project)
+        os.makedirs(args.shard_dir, exist_ok=True)
+        plan_shards(args.main, args.project, args.shards, args.shard_dir, args.key,
+                    args.after_only)
+        return
+
+    plan = _read_plan(args.shard_dir)
+    if not 0 <= args.shard < plan["shards"]:
+        parser.error("--shard has to be from 0 to {}".format(plan["shards"] - 1))
+    try:
+        process_shard(args.shard, args.shard_dir)
+        link_index = None
+        if args.resolve_links:
+            link_index = LinkIndex(plan["project"], args.cache_dir,
+                                   LinkGraph(plan["project"], args.cache_dir))
+        render_shard(args.shard, args.shard_dir, link_index, args.timeout, args.search)
+    except (Exception, SystemExit) as err:
+        mark_failed(args.shard_dir, args.shard, err)
+        raise
+
+
+if __name__ == "__main__":
+    main()
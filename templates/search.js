@@ -0,0 +1,122 @@
+/* Search box for the published project pages.
+   The index is static json in the search folder next to the pages: items.json lists the
+   items, and terms-<c>.json has the item numbers for each term starting with c.  Only the
+   term files for the words typed in are loaded.  A word matches every term it starts, the
+   items have to match all the words. */
+(function () {
+  var input = document.getElementById("search-input");
+  var results = document.getElementById("search-results");
+  if (!input || !results) {
+    return;
+  }
+
+  var SEARCH_FOLDER = "search/";
+  var MAX_RESULTS = 50;
+  var MIN_TERM_LENGTH = 2;
+  var DELAY = 150;
+  // the same terms as search_index.py, letters, digits and underscores
+  var TERM = /[\p{L}\p{N}_]+/gu;
+
+  var loaded = {};
+  var timer = null;
+  var latest = "";
+  var page = window.location.pathname.split("/").pop() || "index.html";
+
+  function load(name) {
+    if (!loaded[name]) {
+      loaded[name] = fetch(SEARCH_FOLDER + name).then(function (response) {
+        if (!response.ok) {
+          throw new Error(response.status + " " + name);
+        }
+        return response.json();
+      });
+    }
+    return loaded[name];
+  }
+
+  function terms(query) {
+    var words = query.toLowerCase().match(TERM) || [];
+    return words.filter(function (word) { return word.length >= MIN_TERM_LENGTH; });
+  }
+
+  // same rule as search_index._shard
+  function shard(term) {
+    return /^[a-z0-9]/.test(term) ? term.charAt(0) : "_";
+  }
+
+  function matches(word, index) {
+    if (index.shards.indexOf(shard(word)) < 0) {
+      return Promise.resolve([]);
+    }
+    return load("terms-" + shard(word) + ".json").then(function (postings) {
+      var found = {};
+      Object.keys(postings).forEach(function (term) {
+        if (term.lastIndexOf(word, 0) === 0) {
+          postings[term].forEach(function (number) { found[number] = true; });
+        }
+      });
+      return Object.keys(found).map(Number);
+    });
+  }
+
+  function show(index, numbers, message) {
+    results.innerHTML = "";
+    if (message) {
+      var note = document.createElement("li");
+      note.textContent = message;
+      results.appendChild(note);
+      return;
+    }
+    numbers.sort(function (a, b) { return a - b; });
+    numbers.slice(0, MAX_RESULTS).forEach(function (number) {
+      var item = index.items[number];
+      var entry = document.createElement("li");
+      var link = document.createElement("a");
+      link.href = (item[3] === page ? "" : item[3]) + "#" + item[0];
+      link.textContent = item[1] ? item[0] + " " + item[1] : item[0];
+      entry.appendChild(link);
+      var prefix = document.createElement("small");
+      prefix.textContent = " " + item[2];
+      entry.appendChild(prefix);
+      results.appendChild(entry);
+    });
+    if (numbers.length > MAX_RESULTS) {
+      var more = document.createElement("li");
+      more.textContent = (numbers.length - MAX_RESULTS) + " more, add words to narrow it down";
+      results.appendChild(more);
+    }
+  }
+
+  function search() {
+    var query = input.value;
+    var words = terms(query);
+    latest = query;
+    if (!words.length) {
+      results.innerHTML = "";
+      return;
+    }
+    load("items.json").then(function (index) {
+      return Promise.all(words.map(function (word) { return matches(word, index); }))
+        .then(function (lists) {
+          if (query !== latest) {
+            return;
+          }
+          var numbers = lists.reduce(function (found, list) {
+            var keep = {};
+            list.forEach(function (number) { keep[number] = true; });
+            return found.filter(function (number) { return keep[number]; });
+          });
+          show(index, numbers, numbers.length ? "" : "No matching items");
+        });
+    }).catch(function () {
+      // browsers don't let pages opened from disk read the index
+      show(null, [], "The search index could not be loaded, serve the pages with " +
+                     "'python main.py serve' to search them");
+    });
+  }
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    timer = setTimeout(search, DELAY);
+  });
+})();
@@ -0,0 +1,7 @@
+"""
+    The modules are imported from the top of the repo, like main.py does.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,93 @@
+"""
+    The change manifest records read from a branch diff.
+"""
+import io
+import json
+
+import pytest
+from unidiff import PatchSet
+
+import change_manifest
+from change_manifest import write_manifest
+
+DIFF = """\
+diff --git REQ/.doorstop.yml REQ/.doorstop.yml
+--- REQ/.doorstop.yml
++++ REQ/.doorstop.yml
+@@ -1,2 +1,2 @@
+ settings:
+-  digits: 3
++  digits: 4
+diff --git REQ/REQ001.yml REQ/REQ001.yml
+--- REQ/REQ001.yml
++++ REQ/REQ001.yml
+@@ -1,5 +1,5 @@
+ active: true
+-level: 1.1
++level: 1.2
+ links: []
+ text: |
+-  The old text
++  The new text
+diff --git REQ/REQ002.yml REQ/REQ002.yml
+--- REQ/REQ002.yml
++++ REQ/REQ002.yml
+@@ -1,3 +1,3 @@
+ active: true
+-header: Old
++header: New
+ text: Same
+diff --git REQ/REQ003.yml REQ/REQ003.yml
+new file mode 100644
+--- /dev/null
++++ REQ/REQ003.yml
+@@ -0,0 +1,2 @@
++header: Added
++text: Added text
+diff --git REQ/REQ004.yml REQ/REQ004.yml
+deleted file mode 100644
+--- REQ/REQ004.yml
++++ /dev/null
+@@ -1,2 +0,0 @@
+-header: Removed
+-text: Removed text
+"""
+
+
+@pytest.fixture
+def records(tmp_path, monkeypatch):
+    """the manifest records of the diff, in a folder with the document config"""
+    (tmp_path / "REQ").mkdir()
+    (tmp_path / "REQ" / ".doorstop.yml").write_text("settings:\n  prefix: RQ\n",
+                                                    encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(change_manifest, "_PREFIXES", {})
+    stream = io.StringIO()
+    assert write_manifest(PatchSet(io.StringIO(DIFF)), stream) == 4
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_modified_record(records):
+    assert records[0] == {
+        "uid": "REQ001", "prefix": "RQ", "path": "REQ/REQ001.yml", "change": "modified",
+        "fields": ["level", "text"],
+        "before": {"level": 1.1, "text": "The old text\n"},
+        "after": {"level": 1.2, "text": "The new text\n"},
+        "normative": True}
+
+
+def test_non_normative_record(records):
+    assert records[1]["fields"] == ["header"]
+    assert (records[1]["before"], records[1]["after"]) == ({"header": "Old"}, {"header": "New"})
+    assert records[1]["normative"] is False
+
+
+def test_added_and_removed_records(records):
+    added, removed = records[2], records[3]
+    assert (added["uid"], added["change"], removed["uid"], removed["change"]) == (
+        "REQ003", "added", "REQ004", "removed")
+    assert added["before"] == {"header": None, "text": None}
+    assert added["after"] == {"header": "Added", "text": "Added text"}
+    assert removed["before"] == {"header": "Removed", "text": "Removed text"}
+    assert removed["after"] == {"header": None, "text": None}
+    assert added["normative"] and removed["normative"]
@@ -0,0 +1,95 @@
+"""
+    The link graph and the items downstream of the changed and removed items.
+"""
+import os
+import subprocess
+
+import pytest
+
+import impact
+from impact import LinkGraph, impact_section
+
+ITEM = "active: true\nheader: '{h}'\nlevel: 1\nlinks: [{l}]\nnormative: true\ntext: {t}\n"
+
+
+def _git(*args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] +
+                   list(args), check=True, stdout=subprocess.DEVNULL)
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as stream:
+        stream.write(text)
+
+
+@pytest.fixture
+def project_repo(tmp_path, monkeypatch):
+    """OVR001 is changed and REQ001 removed on the project branch.  REQ001 and REQ002 link
+        to OVR001, SUB001 to REQ001 and SUB002 to SUB001"""
+    repo = tmp_path / "repo"
+    for prefix in ["OVR", "REQ", "SUB"]:
+        (repo / prefix).mkdir(parents=True)
+    monkeypatch.chdir(repo)
+    _git("init", "-q", "-b", "master")
+    _write("OVR/.doorstop.yml", "settings:\n  prefix: OVR\n")
+    _write("REQ/.doorstop.yml", "settings:\n  prefix: REQ\n  parent: OVR\n")
+    _write("SUB/.doorstop.yml", "settings:\n  prefix: SUB\n  parent: REQ\n")
+    _write("OVR/OVR001.yml", ITEM.format(h="Overview", l="", t="old"))
+    _write("REQ/REQ001.yml", ITEM.format(h="Req 1", l="OVR001", t="one"))
+    _write("REQ/REQ002.yml", ITEM.format(h="Req 2", l="{OVR001: abc}", t="two"))
+    _write("SUB/SUB001.yml", ITEM.format(h="Sub 1", l="REQ001", t="one"))
+    _write("SUB/SUB002.yml", ITEM.format(h="Sub 2", l="SUB001", t="two"))
+    _git("add", ".")
+    _git("commit", "-q", "-m", "main")
+    _git("checkout", "-q", "-b", "project/ProjA")
+    _write("OVR/OVR001.yml", ITEM.format(h="Overview", l="", t="new"))
+    os.remove("REQ/REQ001.yml")
+    _git("add", "-A")
+    _git("commit", "-q", "-m", "project")
+    return repo
+
+
+def test_graph_arrays_and_cache(project_repo, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    graph = LinkGraph("master", cache_dir)
+    assert graph.numbers == {"OVR001": 0, "REQ001": 1, "REQ002": 2, "SUB001": 3, "SUB002": 4}
+    assert graph.offsets.tolist() == [0, 2, 3, 3, 4, 4]
+    assert graph.children.tolist() == [1, 2, 3, 4]
+    assert graph.headers == ["Overview", "Req 1", "Req 2", "Sub 1", "Sub 2"]
+    assert graph.prefixes == ["OVR", "REQ", "REQ", "SUB", "SUB"]
+    assert graph.child_uids("OVR001") == ["REQ001", "REQ002"]
+    assert graph.child_uids("NOPE") == []
+    assert os.path.isfile(graph.cache_path)
+
+    # the next graph for the commit is loaded from the cache, not read from git again
+    def no_reads(*args):
+        raise AssertionError("the graph was built again")
+    monkeypatch.setattr(impact, "_read_blobs", no_reads)
+    cached = LinkGraph("master", cache_dir)
+    assert cached.numbers == graph.numbers
+    assert cached.children == graph.children and cached.offsets == graph.offsets
+
+
+def test_impact_follows_removed_items(project_repo, tmp_path):
+    graph = LinkGraph("project/ProjA", str(tmp_path / "cache"), "master")
+    changed, removed, impacted = graph.impact(["OVR001"])
+    assert changed == ["OVR001"]
+    assert removed == ["REQ001"]
+    assert [(entry["uid"], entry["depth"], entry["through"]) for entry in impacted] == [
+        ("REQ002", 1, "OVR001"), ("SUB001", 1, "REQ001"), ("SUB002", 2, "SUB001")]
+    assert impacted[0]["header"] == "Req 2"
+    assert impacted[0]["prefix"] == "REQ"
+
+
+def test_impact_section_counts():
+    entry = {"uid": "REQ002", "header": "a < b", "prefix": "REQ", "depth": 1,
+             "through": "OVR001"}
+    one = impact_section([entry], ["REQ001"])
+    assert "1 item links to the changed items" in one
+    assert "isn't part of the project" in one
+    assert "1 item was removed, the items that linked to it " in one
+    assert "a &lt; b" in one
+    two = impact_section([entry, entry], ["REQ001", "REQ003"])
+    assert "2 items link to the changed items" in two
+    assert "2 items were removed, the items that linked to them " in two
+    assert "No other items" in impact_section([])
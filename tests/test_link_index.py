@@ -0,0 +1,100 @@
+"""
+    Link resolution against the whole tree at the project commit.
+"""
+import subprocess
+
+import pytest
+from doorstop.common import DoorstopError
+from doorstop.core.item import UnknownItem
+
+import link_index
+from link_index import LinkIndex, LazyTree
+from impact import LinkGraph
+
+ITEM = "active: true\nheader: '{h}'\nlevel: 1\nlinks: [{l}]\nnormative: true\ntext: ''\n"
+
+
+def _git(*args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] +
+                   list(args), check=True, stdout=subprocess.DEVNULL)
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as stream:
+        stream.write(text)
+
+
+@pytest.fixture
+def linked_repo(tmp_path, monkeypatch):
+    """REQ002 links to REQ001, SUB001 and SUB002 link to REQ001 and REQ002"""
+    repo = tmp_path / "repo"
+    (repo / "REQ").mkdir(parents=True)
+    (repo / "SUB").mkdir()
+    monkeypatch.chdir(repo)
+    _git("init", "-q", "-b", "master")
+    _write("REQ/.doorstop.yml", "settings:\n  prefix: REQ\n")
+    _write("SUB/.doorstop.yml", "settings:\n  prefix: SUB\n  parent: REQ\n")
+    _write("REQ/REQ001.yml", ITEM.format(h="First", l=""))
+    _write("REQ/REQ002.yml", ITEM.format(h="Second", l="REQ001"))
+    _write("SUB/SUB001.yml", ITEM.format(h="Sub one", l="REQ001"))
+    _write("SUB/SUB002.yml", ITEM.format(h="Sub two", l="REQ002"))
+    _git("add", ".")
+    _git("commit", "-q", "-m", "main")
+    return repo
+
+
+class _Item:
+    """the parts of a published item LazyTree uses"""
+    def __init__(self, uid, links):
+        self.uid = uid
+        self.links = links
+
+    def find_child_items(self):
+        return []
+
+
+class _Tree:
+    """a published tree of one document"""
+    def __init__(self, items):
+        self.items = items
+
+    def __iter__(self):
+        return iter([self])
+
+    def find_item(self, uid):
+        for item in self.items:
+            if item.uid == uid:
+                return item
+        raise DoorstopError("no item with UID: {}".format(uid))
+
+
+def test_links_read_in_one_go(linked_repo, tmp_path, monkeypatch):
+    reads = []
+    read_blobs = link_index._read_blobs
+
+    def counted(commit, paths):
+        reads.append(sorted(paths))
+        return read_blobs(commit, paths)
+    monkeypatch.setattr(link_index, "_read_blobs", counted)
+
+    cache_dir = str(tmp_path / "cache")
+    index = LinkIndex("master", cache_dir, LinkGraph("master", cache_dir))
+    item = _Item("REQ002", ["REQ001"])
+    tree = LazyTree(_Tree([item]), index)
+
+    parents = tree.parent_items(item)
+    assert [(str(parent.uid), parent.header) for parent in parents] == [("REQ001", "First")]
+    children = tree.child_items(item)
+    assert [(str(child.uid), child.header) for child in children] == [("SUB002", "Sub two")]
+    assert tree.find_item("REQ002") is item
+    assert isinstance(tree.find_item("NOPE001"), UnknownItem)
+    assert reads == [["REQ/REQ001.yml", "SUB/SUB002.yml"]]
+
+
+def test_children_without_graph(linked_repo, tmp_path):
+    index = LinkIndex("master", str(tmp_path / "cache"))
+    item = _Item("REQ001", [])
+    tree = LazyTree(_Tree([item]), index)
+    assert tree.child_items(item) == []
+    assert [str(uid) for uid in LinkGraph("master", str(tmp_path / "cache")).child_uids(
+        "REQ001")] == ["REQ002", "SUB001"]
@@ -0,0 +1,83 @@
+"""
+    Code blocks in the text of the items, from the diff to the item lines.
+"""
+import io
+import os
+
+from unidiff import PatchSet
+
+from common import (CODE_BLOCK_END, BLOCK_END, REMOVED_BLOCK_START, ADDED_BLOCK_START,
+                    REMOVED_LINE, ADDED_LINE)
+from process_diff import _CodeBlock, _process_patched_file
+
+FENCE = "  ```plantuml\n"
+CLOSE = "  ```\n"
+AB = "  A -> B\n"
+BC = "  B -> C\n"
+BD = "  B -> D\n"
+
+
+def _patched_file(text_lines):
+    """the patched file of an item diff, with the text field lines given as diff lines"""
+    lines = [" active: true\n", " links: []\n", " text: |\n"] + text_lines
+    removed = sum(1 for line in lines if not line.startswith("+"))
+    added = sum(1 for line in lines if not line.startswith("-"))
+    diff = ("diff --git REQ/REQ001.yml REQ/REQ001.yml\n--- REQ/REQ001.yml\n+++ REQ/REQ001.yml\n"
+            "@@ -1,{} +1,{} @@\n".format(removed, added) + "".join(lines))
+    return PatchSet(io.StringIO(diff))[0]
+
+
+def _block(diff_lines):
+    """a code block read from the lines of a diff"""
+    patched_file = _patched_file([" " + FENCE] + diff_lines)
+    block = _CodeBlock(FENCE)
+    for line in list(patched_file[0])[4:]:
+        block.append(line)
+    return block
+
+
+def test_unchanged_block_once():
+    block = _block([" " + AB, " " + BC])
+    assert block.lines(CLOSE) == [FENCE, AB, BC, CLOSE]
+
+
+def test_changed_block_both_sides():
+    block = _block([" " + AB, "-" + BC, "+" + BD])
+    assert block.lines(CLOSE) == [
+        REMOVED_BLOCK_START, FENCE, AB, BC, CODE_BLOCK_END, BLOCK_END,
+        ADDED_BLOCK_START, FENCE, AB, BD, CODE_BLOCK_END, BLOCK_END]
+
+
+def test_added_block_one_side():
+    block = _block(["+" + AB])
+    assert block.lines(CLOSE) == [ADDED_BLOCK_START, FENCE, AB, CODE_BLOCK_END, BLOCK_END]
+
+
+def _item(tmp_path, monkeypatch, text_lines):
+    """process the diff of an item, and read the item that was written"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("REQ")
+    with open(os.path.join("REQ", ".doorstop.yml"), "w", encoding="utf-8") as stream:
+        stream.write("settings:\n  prefix: REQ\n")
+    temp_path = str(tmp_path / "temp")
+    assert _process_patched_file(_patched_file(text_lines), temp_path, [])
+    with open(os.path.join(temp_path, "REQ", "REQ001.yml"), encoding="utf-8",
+              newline="") as stream:
+        return stream.read()
+
+
+def test_item_with_unchanged_block(tmp_path, monkeypatch):
+    item = _item(tmp_path, monkeypatch, ["-  Old line\n", "+  New line\n", " " + FENCE,
+                                         " " + AB, " " + CLOSE, "   After\n"])
+    assert REMOVED_LINE.format("Old line") in item
+    assert ADDED_LINE.format("New line") in item
+    # the block didn't change, it is published once as it is
+    assert FENCE + AB + CLOSE in item
+    assert REMOVED_BLOCK_START not in item
+
+
+def test_item_with_unterminated_block(tmp_path, monkeypatch):
+    item = _item(tmp_path, monkeypatch, [" " + FENCE, " " + AB, "-" + BC, "+" + BD])
+    # the hunk ends in the block, both sides are still published and closed
+    assert item.endswith(REMOVED_BLOCK_START + FENCE + AB + BC + CODE_BLOCK_END + BLOCK_END +
+                         ADDED_BLOCK_START + FENCE + AB + BD + CODE_BLOCK_END + BLOCK_END)
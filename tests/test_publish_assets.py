@@ -0,0 +1,72 @@
+"""
+    The css minifier and the stylesheet bundle.
+"""
+import os
+
+from publish_assets import _minify_css, sync_assets, css_bundle, CSS_BUNDLE
+from renderer import get_renderer
+
+
+def test_minify_declarations():
+    assert _minify_css("p {\n  color : red ;\n  margin: 0 auto;\n}\n") == "p{color:red;margin:0 auto}"
+
+
+def test_minify_keeps_strings():
+    assert _minify_css('.a::before { content: ": " ; }') == '.a::before{content:": "}'
+    assert (_minify_css("q { content: '{ a; b }' ; font-family: \"A B\", serif }") ==
+            "q{content:'{ a; b }';font-family:\"A B\",serif}")
+
+
+def test_minify_keeps_urls():
+    assert (_minify_css('div { background: url( "x: y.png" ) no-repeat ; }') ==
+            'div{background:url( "x: y.png" ) no-repeat}')
+
+
+def test_minify_keeps_descendant_colon():
+    assert _minify_css("a :hover { color: red }") == "a :hover{color:red}"
+    assert (_minify_css("@media (min-width: 10px) { a :hover , b > c { margin : 0 } }") ==
+            "@media (min-width: 10px){a :hover,b>c{margin:0}}")
+
+
+def test_minify_comments():
+    assert _minify_css("/* a: b */ p { color: red; /* x */ }") == "p{color:red}"
+    assert _minify_css("p{x:1}\n/*! license: kept */") == "p{x:1}/*! license: kept */"
+
+
+def _sources(tmp_path, files):
+    source = tmp_path / "source"
+    for rel_path, text in files.items():
+        (source / rel_path).parent.mkdir(parents=True, exist_ok=True)
+        (source / rel_path).write_text(text, encoding="utf-8")
+    return [(str(source), "")]
+
+
+def test_bundle_linked_when_written(tmp_path):
+    sources = _sources(tmp_path, {"doorstop/general.css": "p { color: red; }"})
+    bundle = css_bundle(sync_assets(str(tmp_path / "public"), sources))
+    assert bundle == CSS_BUNDLE
+    assert os.path.isfile(str(tmp_path / "public" / "assets" / CSS_BUNDLE))
+    html = get_renderer().render_page("", None, css_bundle=bundle)
+    assert CSS_BUNDLE in html
+    assert "general.css" not in html
+
+
+def test_manifest_has_no_paths(tmp_path):
+    sources = _sources(tmp_path, {"doorstop/general.css": "p { color: red; }"})
+    manifest = sync_assets(str(tmp_path / "public"), sources, store=str(tmp_path / "store"))
+    text = (tmp_path / "public" / "assets" / "manifest.json").read_text(encoding="utf-8")
+    assert str(tmp_path) not in text
+    assert manifest["files"]["doorstop/general.css"]["action"] == "linked"
+    # a second sync sees the same source and leaves the asset in place
+    manifest = sync_assets(str(tmp_path / "public"), sources, store=str(tmp_path / "store"))
+    assert manifest["files"]["doorstop/general.css"]["action"] == "unchanged"
+
+
+def test_stylesheets_linked_without_bundle(tmp_path):
+    sources = _sources(tmp_path, {"doorstop/other.js": "var a;"})
+    bundle = css_bundle(sync_assets(str(tmp_path / "public"), sources))
+    assert bundle is None
+    assert not os.path.exists(str(tmp_path / "public" / "assets" / CSS_BUNDLE))
+    html = get_renderer().render_page("", None, css_bundle=bundle)
+    assert CSS_BUNDLE not in html
+    assert "assets/doorstop/general.css" in html
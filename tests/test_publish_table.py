@@ -0,0 +1,44 @@
+"""
+    The direct html tables against the markdown tables they replace.
+"""
+import pytest
+
+from bench_tables import (CHECK_CELLS, PIPE_CELLS, ROW, CELL, _BenchDocument, _BenchItem,
+                          _markdown_path, _direct_path)
+
+# more markdown syntax, html tags and block starts on top of the benchmark check cells
+CELLS = CHECK_CELLS + ["**strong** and <i>tag</i>", "+ plus", "* star", "## level two",
+                       "1) paren", "> `a` > b", "<br> alone", "`code <b>`", "[link](page.html)"]
+
+
+def _items(cell, heading="Table"):
+    """a table with a heading and one row with the cell in a column and in the notes"""
+    document = _BenchDocument("TAB", ["value"])
+    note = "note" if cell is None else cell
+    return [_BenchItem(document, "TAB00001", "1.0", True, heading, {}),
+            _BenchItem(document, "TAB00002", "1.1", False, "Field\n{}".format(note),
+                       {"value": cell})]
+
+
+@pytest.mark.parametrize("cell", CELLS)
+def test_cell_matches_markdown(cell):
+    markdown_rows = ROW.findall(_markdown_path(_items(cell)))
+    direct_rows = ROW.findall(_direct_path(_items(cell)))
+    assert len(direct_rows) == 2
+    assert direct_rows == markdown_rows
+
+
+@pytest.mark.parametrize("cell", sorted(PIPE_CELLS))
+def test_pipe_cell(cell):
+    # a markdown table cuts the cell at the pipe, the direct table keeps the whole value
+    markdown_row = ROW.findall(_markdown_path(_items(cell)))[1]
+    direct_row = ROW.findall(_direct_path(_items(cell)))[1]
+    assert (CELL.findall(markdown_row)[1], CELL.findall(direct_row)[1]) == PIPE_CELLS[cell]
+
+
+@pytest.mark.parametrize("heading", ["Plain", "*Emphasis*", "a < b"])
+def test_heading_matches_markdown(heading):
+    markdown_heading = _markdown_path(_items("value", heading)).split("\n", 1)[0]
+    direct_heading = _direct_path(_items("value", heading)).split("\n", 1)[0]
+    # the direct heading always has the anchor the table of contents links to
+    assert direct_heading.replace(' id="TAB00001"', "") == markdown_heading
@@ -0,0 +1,74 @@
+"""
+    The search index and its shards by the first character of the terms.
+"""
+import json
+import os
+
+from search_index import SearchIndex, _terms, SEARCH_FOLDER, ITEMS_FILE, TERMS_FILE
+
+
+class _Document:
+    def __init__(self, prefix):
+        self.prefix = prefix
+
+
+class _Item:
+    """the parts of an item the search index reads"""
+    def __init__(self, uid, header, text, attributes=None):
+        self.uid = uid
+        self.header = header
+        self.text = text
+        self.document = _Document(uid[:3])
+        self._attributes = attributes or {}
+
+    def attribute(self, name):
+        return self._attributes.get(name)
+
+
+def _read(publish_path, name):
+    with open(os.path.join(publish_path, SEARCH_FOLDER, name), encoding="utf-8") as stream:
+        return json.load(stream)
+
+
+def test_terms():
+    assert _terms("REQ001", "Brake <b>pressure</b> &amp; 2 bar", None, "") == {
+        "req001", "brake", "pressure", "bar"}
+    assert _terms('<span style="color:red"><del>Old</del></span>') == {"old"}
+    assert _terms("Über straße") == {"über", "straße"}
+
+
+def test_write_shards(tmp_path):
+    index = SearchIndex()
+    index.start("REQ", "index.html")
+    index.add(_Item("REQ001", "Brake", "Brake pressure"))
+    index.add(_Item("REQ002", "", "Pressure 9 bar"))
+    index.start("TAB", "TAB.html")
+    index.add(_Item("TAB001", "Table", "", {"value": "über"}), ["value"])
+    publish_path = str(tmp_path)
+    assert index.write(publish_path, ["REQ", "TAB"]) == (3, 8)
+
+    items = _read(publish_path, ITEMS_FILE)
+    assert items["items"] == [["REQ001", "Brake", "REQ", "index.html"],
+                              ["REQ002", "", "REQ", "index.html"],
+                              ["TAB001", "Table", "TAB", "TAB.html"]]
+    assert items["shards"] == ["_", "b", "p", "r", "t"]
+    assert _read(publish_path, TERMS_FILE.format("b")) == {"bar": [1], "brake": [0]}
+    assert _read(publish_path, TERMS_FILE.format("p")) == {"pressure": [0, 1]}
+    assert _read(publish_path, TERMS_FILE.format("r")) == {"req001": [0], "req002": [1]}
+    assert _read(publish_path, TERMS_FILE.format("t")) == {"tab001": [2], "table": [2]}
+    assert _read(publish_path, TERMS_FILE.format("_")) == {"über": [2]}
+
+    # a shard that has no terms left is removed
+    index.retain(["REQ"])
+    assert index.write(publish_path, ["REQ"]) == (2, 5)
+    assert not os.path.exists(os.path.join(publish_path, SEARCH_FOLDER, TERMS_FILE.format("t")))
+    assert _read(publish_path, ITEMS_FILE)["shards"] == ["b", "p", "r"]
+
+
+def test_export_and_load():
+    index = SearchIndex()
+    index.start("REQ", "index.html")
+    index.add(_Item("REQ001", "Brake", "pressure"))
+    other = SearchIndex()
+    other.load("REQ", index.export("REQ"))
+    assert other.sections == index.sections
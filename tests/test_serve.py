@@ -0,0 +1,36 @@
+"""
+    What the preview server sends from a published folder.
+"""
+import os
+
+from serve import PublishedSite
+
+
+def _write(folder, rel_path, text="x"):
+    path = os.path.join(folder, *rel_path.split("/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as stream:
+        stream.write(text)
+
+
+def test_find_pages(tmp_path):
+    _write(str(tmp_path), "index.html", "<html></html>")
+    _write(str(tmp_path), "assets/doorstop/general.css")
+    site = PublishedSite(str(tmp_path))
+    path, entry = site.find("")
+    assert path == os.path.join(str(tmp_path), "index.html")
+    assert entry["sha256"]
+    assert site.find("assets/doorstop/general.css") is not None
+    assert site.find("missing.html") is None
+
+
+def test_build_metadata_not_served(tmp_path):
+    for rel_path in [".release", ".hidden/page.html", "content.json", "assets/manifest.json",
+                     "assets/manifest.json.gz"]:
+        _write(str(tmp_path), rel_path)
+    site = PublishedSite(str(tmp_path))
+    assert site.find(".release") is None
+    assert site.find(".hidden/page.html") is None
+    assert site.find("content.json") is None
+    assert site.find("assets/manifest.json") is None
+    assert site.find("assets/manifest.json.gz") is None
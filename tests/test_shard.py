@@ -0,0 +1,120 @@
+"""
+    Sharded publishing against a normal run, and stopping the shards when one fails.
+"""
+import os
+import subprocess
+
+import pytest
+
+import shard
+from shard import (plan_shards, process_shard, render_shard, merge_fragments, run_shards,
+                   SHARD_BY_PREFIX, SHARD_BY_PATH, FAILED)
+from vcs_common import _read_branch_diff
+from process_diff import _process_diff, _build_tree
+from publish_project import publish_project
+
+OVR_DOCUMENT = "settings:\n  digits: 3\n  prefix: OVR\n  sep: ''\n"
+REQ_DOCUMENT = "settings:\n  digits: 3\n  parent: OVR\n  prefix: REQ\n  sep: ''\n"
+ITEM = ("active: true\nderived: false\nheader: '{h}'\nlevel: {v}\nlinks: [{l}]\n"
+        "normative: true\nref: ''\nreviewed: null\ntext: |\n  {t}\n")
+
+
+def _git(*args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] +
+                   list(args), check=True, stdout=subprocess.DEVNULL)
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as stream:
+        stream.write(text)
+
+
+@pytest.fixture
+def project_repo(tmp_path, monkeypatch):
+    """a repo with an overview and requirements changed on the project branch"""
+    repo = tmp_path / "repo"
+    (repo / "OVR").mkdir(parents=True)
+    (repo / "REQ").mkdir()
+    monkeypatch.chdir(repo)
+    _git("init", "-q", "-b", "master")
+    _write("OVR/.doorstop.yml", OVR_DOCUMENT)
+    _write("REQ/.doorstop.yml", REQ_DOCUMENT)
+    _write("OVR/OVR001.yml", ITEM.format(h="Overview", v=1, l="", t="The overview"))
+    for number in range(1, 5):
+        _write("REQ/REQ00{}.yml".format(number),
+               ITEM.format(h="Req {}".format(number), v="1.{}".format(number), l="OVR001",
+                           t="Requirement {}".format(number)))
+    _git("add", ".")
+    _git("commit", "-q", "-m", "main")
+    _git("checkout", "-q", "-b", "project/ProjA")
+    _write("OVR/OVR001.yml", ITEM.format(h="Overview", v=1, l="", t="The new overview"))
+    _write("REQ/REQ002.yml", ITEM.format(h="Req 2", v="1.2", l="OVR001", t="Changed 2"))
+    _write("REQ/REQ005.yml", ITEM.format(h="Req 5", v="1.5", l="OVR001", t="Added 5"))
+    os.remove("REQ/REQ004.yml")
+    _git("add", "-A")
+    _git("commit", "-q", "-m", "project")
+    return repo
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as stream:
+        return stream.read()
+
+
+@pytest.mark.parametrize("shards, key", [(1, SHARD_BY_PREFIX), (2, SHARD_BY_PREFIX),
+                                         (3, SHARD_BY_PATH)])
+def test_merge_matches_normal_run(project_repo, tmp_path, shards, key):
+    temp_path = str(tmp_path / "normal")
+    tree = _build_tree(temp_path, _process_diff(
+        _read_branch_diff("master", "project/ProjA"), temp_path))
+    publish_project(tree, "project/ProjA", os.path.join(temp_path, "public"))
+
+    shard_dir = str(tmp_path / "shards")
+    plan_shards("master", "project/ProjA", shards, shard_dir, key)
+    for number in range(shards):
+        process_shard(number, shard_dir)
+    for number in range(shards):
+        render_shard(number, shard_dir)
+    merge_fragments(shard_dir, str(tmp_path / "merged"))
+
+    normal = _read(os.path.join(temp_path, "public", "index.html"))
+    assert "Changed 2" in normal and "Added 5" in normal
+    assert _read(str(tmp_path / "merged" / "index.html")) == normal
+
+
+class _Process:
+    """stands in for a shard process, it exits with the code after a number of polls"""
+    def __init__(self, returncode, polls):
+        self.returncode = None
+        self._exit = returncode
+        self._polls = polls
+        self.killed = False
+
+    def poll(self):
+        if self.killed or self._polls <= 0:
+            self.returncode = -9 if self.killed else self._exit
+            return self.returncode
+        self._polls -= 1
+        return None
+
+    def kill(self):
+        self.killed = True
+
+    def wait(self):
+        return self.poll()
+
+
+def test_failed_shard_stops_the_others(tmp_path, monkeypatch):
+    processes = {"0": _Process(0, 1000), "1": _Process(3, 1), "2": _Process(0, 1000)}
+    monkeypatch.setattr(shard, "plan_shards", lambda *args, **kwargs: None)
+    monkeypatch.setattr(shard, "POLL_INTERVAL", 0)
+    monkeypatch.setattr(shard.subprocess, "Popen", lambda command: processes[command[-1]])
+    shard_dir = str(tmp_path / "shards")
+
+    with pytest.raises(SystemExit) as exit_info:
+        run_shards("master", "project/ProjA", 3, shard_dir, str(tmp_path / "public"))
+    assert exit_info.value.code == 1
+    assert processes["0"].killed and processes["2"].killed
+    assert not processes["1"].killed
+    assert os.path.isfile(os.path.join(shard_dir, FAILED.format(1)))
+    assert not os.path.exists(str(tmp_path / "public"))
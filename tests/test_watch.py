@@ -0,0 +1,77 @@
+"""
+    Watch mode against a small requirements repo made for each test.
+"""
+import os
+import subprocess
+
+import pytest
+
+import watch
+from common import REMOVED_LINE
+from watch import ProjectWatcher
+
+DOCUMENT = "settings:\n  digits: 3\n  prefix: REQ\n  sep: ''\n"
+ITEM = ("active: true\nderived: false\nheader: 'Req 1'\nlevel: 1.1\nlinks: []\n"
+        "normative: true\nref: ''\nreviewed: null\ntext: |\n  {}\n")
+
+
+def _git(*args):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com"] +
+                   list(args), check=True, stdout=subprocess.DEVNULL)
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8", newline="") as stream:
+        stream.write(text)
+
+
+@pytest.fixture
+def project_repo(tmp_path, monkeypatch):
+    """a repo with one requirement changed on the project branch, checked out"""
+    repo = tmp_path / "repo"
+    (repo / "REQ").mkdir(parents=True)
+    monkeypatch.chdir(repo)
+    _git("init", "-q", "-b", "master")
+    _write("REQ/.doorstop.yml", DOCUMENT)
+    _write("REQ/REQ001.yml", ITEM.format("The old text"))
+    _git("add", ".")
+    _git("commit", "-q", "-m", "main")
+    _git("checkout", "-q", "-b", "project/ProjA")
+    _write("REQ/REQ001.yml", ITEM.format("The new text"))
+    _git("commit", "-q", "-am", "project")
+    return repo
+
+
+def _published(watcher):
+    with open(os.path.join(watcher.temp_path, "REQ", "REQ001.yml"), encoding="utf-8") as stream:
+        return stream.read()
+
+
+@pytest.mark.parametrize("after_only", [False, True])
+def test_poll_after_only(project_repo, tmp_path, after_only):
+    watcher = ProjectWatcher("master", "project/ProjA", {}, str(tmp_path / "work"),
+                             after_only=after_only)
+    assert watcher.poll() == 1
+    removed = REMOVED_LINE.format("The old text").strip()
+    assert (removed in _published(watcher)) != after_only
+
+    # an edit in the working tree is processed the same way
+    _write("REQ/REQ001.yml", ITEM.format("The newer text"))
+    assert watcher.poll() == 1
+    item = _published(watcher)
+    assert "The newer text" in item
+    assert (removed in item) != after_only
+    assert os.path.isfile(os.path.join(watcher.publish_folder, "index.html"))
+
+
+def test_run_reports_on_stderr(project_repo, tmp_path, monkeypatch, capsys):
+    watcher = ProjectWatcher("master", "project/ProjA", {}, str(tmp_path / "work"))
+
+    def stop(interval):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(watch.time, "sleep", stop)
+    watcher.run(0.1)
+    out, err = capsys.readouterr()
+    assert out == ""
+    assert "Watching project/ProjA against master" in err
+    assert "Published 1 changed files" in err
@@ -0,0 +1,79 @@
+"""
+    Run workspaces and the release swap of publish_site.
+"""
+import os
+
+from workspace import run_workspace, publish_site, RELEASE_MARKER
+
+
+def _site(folder, pages):
+    """write a published site with the pages, names to text"""
+    os.makedirs(folder, exist_ok=True)
+    for name, text in pages.items():
+        with open(os.path.join(folder, name), "w", encoding="utf-8") as stream:
+            stream.write(text)
+    return folder
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as stream:
+        return stream.read()
+
+
+def test_run_workspace_creates_root(tmp_path):
+    root = tmp_path / "missing" / "ws"
+    with run_workspace("project_ProjA", str(root)) as path:
+        assert os.path.dirname(path) == str(root)
+        assert os.path.isdir(path)
+    assert not os.path.exists(path)
+
+
+def test_publish_site_swaps_releases(tmp_path):
+    output = str(tmp_path / "out" / "public")
+    first = publish_site(_site(str(tmp_path / "one"), {"index.html": "one"}), output)
+    assert os.path.islink(output)
+    assert os.path.realpath(output) == first
+    assert os.path.isfile(os.path.join(first, RELEASE_MARKER))
+    assert os.path.isfile(os.path.join(str(tmp_path / "out"), ".public.lock"))
+    assert not os.path.exists(str(tmp_path / "one"))
+
+    second = publish_site(_site(str(tmp_path / "two"), {"index.html": "two"}), output)
+    assert second != first
+    assert os.path.realpath(output) == second
+    assert _read(os.path.join(output, "index.html")) == "two"
+    # the old release is removed once the new one is in place
+    assert not os.path.exists(first)
+    releases = [name for name in os.listdir(str(tmp_path / "out")) if name.startswith(".public-")]
+    assert releases == [os.path.basename(second)]
+
+
+def test_publish_site_moves_folder_aside(tmp_path):
+    output = _site(str(tmp_path / "public"), {"notes.txt": "mine"})
+    release = publish_site(_site(str(tmp_path / "site"), {"index.html": "site"}), output)
+    assert os.path.realpath(output) == release
+    aside = [name for name in os.listdir(str(tmp_path))
+             if name.startswith(".public-") and name != os.path.basename(release)]
+    assert len(aside) == 1
+    # a folder that wasn't published here is kept
+    assert _read(os.path.join(str(tmp_path), aside[0], "notes.txt")) == "mine"
+
+    publish_site(_site(str(tmp_path / "site"), {"index.html": "again"}), output)
+    assert os.path.isdir(os.path.join(str(tmp_path), aside[0]))
+
+
+def test_publish_site_copy_reuses_unchanged(tmp_path):
+    source = _site(str(tmp_path / "work"), {"index.html": "one", "page.html": "page"})
+    output = str(tmp_path / "public")
+    first = publish_site(source, output, copy=True)
+    assert os.path.isdir(source)
+    page = os.stat(os.path.join(first, "page.html")).st_ino
+    index = os.stat(os.path.join(first, "index.html")).st_ino
+
+    _site(source, {"index.html": "second"})
+    second = publish_site(source, output, copy=True)
+    assert _read(os.path.join(output, "index.html")) == "second"
+    assert _read(os.path.join(output, "page.html")) == "page"
+    # the unchanged page is hardlinked from the last release, the changed one is copied
+    assert os.stat(os.path.join(second, "page.html")).st_ino == page
+    assert os.stat(os.path.join(second, "index.html")).st_ino != index
+    assert not os.path.exists(first)
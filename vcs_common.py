@@ -1,69 +1,281 @@
-"""Common routines related to VCS (git)"""
-import subprocess
-import sys
-import io
-
-from unidiff import PatchSet
-from common import logger, PIPE
-
-log = logger(__name__)
-
-def _check_branch_fastforward(main_branch, project_branch):
-    # check if the branch being checked can a fast-forward merge.  Log a warning if not.
-    # git merge-base --is-ancestor <commit> <commit>
-    with subprocess.Popen(['git', 'merge-base', '--is-ancestor', main_branch,
-                           project_branch]) as process:
-        process.communicate()
-        if process.returncode:
-            log.warning("Branch %s can not be fast-forwarded to %s " +
-                    "comparison may not be accurate until rebased.", main_branch, project_branch)
-            return False
-    return True
-
-def _check_active_branch(project_branch):
-    # git symbolic-ref --short -q HEAD
-    with subprocess.Popen(['git', 'symbolic-ref', '--short', '-q', 'HEAD'],
-                            stdout=PIPE, stderr=PIPE) as process:
-        stdoutput, stderroutput = process.communicate()
-        if 'fatal' in stderroutput.decode():
-            # Handle error case
-            log.fatal("Error getting active branch %s", stderroutput)
-            sys.exit()
-        if project_branch not in stdoutput.decode():
-            log.fatal("Must check out the branch to check %s", project_branch)
-            log.fatal("Active branch is %s", stdoutput.decode())
-            sys.exit()
-
-def _read_branch_diff(main_branch, project_branch):
-    """ this finds the newest common ancester of both branches to base the diff on
-        this is done so that even after project install and the project branch is 
-        merged into master/production, the original branch can be left in place
-        and this method can still be used to find what was changed.  Note that this
-        will only work if a merge is done with a --no-ff option so that the branch
-        is left as a spur in the history graph
-    """
-    base_commit = main_branch
-    # git merge-base project/ProjA master
-    with subprocess.Popen(['git', 'merge-base', project_branch, main_branch],
-                          stdout=PIPE, stderr=PIPE) as process:
-        stdoutput, stderroutput = process.communicate()
-        if 'fatal' in stderroutput.decode():
-            # Handle error case
-            log.fatal("Error process merge-base: %s", stderroutput)
-            sys.exit()
-        base_commit = stdoutput.decode().strip()
-
-    # get the diff between the two branches.  Save the output.
-    # git diff --no-prefix -U100 master project/ProjA
-    with subprocess.Popen(['git', 'diff', '--no-prefix', '-U10000', base_commit, project_branch],
-                            stdout=PIPE, stderr=PIPE) as process:
-        stdoutput, stderroutput = process.communicate()
-        if 'fatal' in stderroutput.decode():
-            # Handle error case
-            log.fatal("Error process diff: %s", stderroutput)
-            sys.exit()
-
-        # using PatchSet to parse the diff output easily
-        patch_set = PatchSet(io.BytesIO(stdoutput), encoding='utf-8')
-
-        return patch_set
+"""Common routines related to VCS (git)"""
+import asyncio
+import subprocess
+import sys
+import io
+
+from unidiff import PatchSet
+from common import logger, PIPE
+
+log = logger(__name__)
+
+# diff lines can be long for items with big code blocks or tables
+DIFF_STREAM_LIMIT = 1 << 24
+DIFF_FILE_START = b"diff --git "
+
+def _check_branch_fastforward(main_branch, project_branch):
+    # check if the branch being checked can a fast-forward merge.  Log a warning if not.
+    # git merge-base --is-ancestor <commit> <commit>
+    with subprocess.Popen(['git', 'merge-base', '--is-ancestor', main_branch,
+                           project_branch]) as process:
+        process.communicate()
+        if process.returncode:
+            log.warning("Branch %s can not be fast-forwarded to %s " +
+                    "comparison may not be accurate until rebased.", main_branch, project_branch)
+            return False
+    return True
+
+def _check_active_branch(project_branch):
+    # git symbolic-ref --short -q HEAD
+    with subprocess.Popen(['git', 'symbolic-ref', '--short', '-q', 'HEAD'],
+                            stdout=PIPE, stderr=PIPE) as process:
+        stdoutput, stderroutput = process.communicate()
+        if 'fatal' in stderroutput.decode():
+            # Handle error case
+            log.fatal("Error getting active branch %s", stderroutput)
+            sys.exit()
+        if project_branch not in stdoutput.decode():
+            log.fatal("Must check out the branch to check %s", project_branch)
+            log.fatal("Active branch is %s", stdoutput.decode())
+            sys.exit()
+
+def _read_branch_diff(main_branch, project_branch):
+    """ this finds the newest common ancester of both branches to base the diff on
+        this is done so that even after project install and the project branch is 
+        merged into master/production, the original branch can be left in place
+        and this method can still be used to find what was changed.  Note that this
+        will only work if a merge is done with a --no-ff option so that the branch
+        is left as a spur in the history graph
+    """
+    base_commit = main_branch
+    # git merge-base project/ProjA master
+    with subprocess.Popen(['git', 'merge-base', project_branch, main_branch],
+                          stdout=PIPE, stderr=PIPE) as process:
+        stdoutput, stderroutput = process.communicate()
+        if 'fatal' in stderroutput.decode():
+            # Handle error case
+            log.fatal("Error process merge-base: %s", stderroutput)
+            sys.exit()
+        base_commit = stdoutput.decode().strip()
+
+    # get the diff between the two branches.  Save the output.
+    # git diff --no-prefix -U100 master project/ProjA
+    with subprocess.Popen(['git', 'diff', '--no-prefix', '-U10000', base_commit, project_branch],
+                            stdout=PIPE, stderr=PIPE) as process:
+        stdoutput, stderroutput = process.communicate()
+        if 'fatal' in stderroutput.decode():
+            # Handle error case
+            log.fatal("Error process diff: %s", stderroutput)
+            sys.exit()
+
+        # using PatchSet to parse the diff output easily
+        patch_set = PatchSet(io.BytesIO(stdoutput), encoding='utf-8')
+
+        return patch_set
+
+def _git_output(*args):
+    """run a git command and return the output, exits on a fatal error from git"""
+    with subprocess.Popen(['git', *args], stdout=PIPE, stderr=PIPE) as process:
+        stdoutput, stderroutput = process.communicate()
+        if process.returncode or 'fatal' in stderroutput.decode():
+            # Handle error case
+            log.fatal("Error running git %s: %s", args[0], stderroutput)
+            sys.exit()
+    return stdoutput
+
+def _rev_parse(ref):
+    """commit sha for a branch or other ref"""
+    # git rev-parse --verify project/ProjA^{commit}
+    return _git_output('rev-parse', '--verify', ref + '^{commit}').decode().strip()
+
+def _ls_tree(commit):
+    """list of all the file paths in the commit"""
+    # git ls-tree -r -z --name-only <commit>
+    output = _git_output('ls-tree', '-r', '-z', '--name-only', commit).decode()
+    return [path for path in output.split('\0') if path]
+
+def _show_file(commit, path):
+    """contents of a file at the commit"""
+    # git cat-file blob <commit>:<path>
+    return _git_output('cat-file', 'blob', '{}:{}'.format(commit, path)).decode()
+
+def _read_blobs(commit, paths):
+    """contents of the files at the commit, read through a single git process
+
+    :return: the text of each file by path, files that aren't in the commit are left out
+    """
+    # git cat-file --batch, with <commit>:<path> on each line of the input
+    request = "".join("{}:{}\n".format(commit, path) for path in paths).encode()
+    with subprocess.Popen(['git', 'cat-file', '--batch'], stdin=PIPE, stdout=PIPE,
+                          stderr=PIPE) as process:
+        stdoutput, stderroutput = process.communicate(request)
+        if process.returncode:
+            log.fatal("Error reading files from %s: %s", commit, stderroutput)
+            sys.exit()
+
+    blobs = {}
+    position = 0
+    for path in paths:
+        end = stdoutput.index(b"\n", position)
+        header = stdoutput[position:end].split()
+        position = end + 1
+        if header[-1] == b"missing":
+            continue
+        size = int(header[2])
+        blobs[path] = stdoutput[position:position + size].decode()
+        # the contents are followed by a newline
+        position += size + 1
+    return blobs
+
+def _merge_base(main_branch, project_branch):
+    """newest common ancester of both branches, see _read_branch_diff"""
+    # git merge-base project/ProjA master
+    return _git_output('merge-base', project_branch, main_branch).decode().strip()
+
+def _worktree_changes():
+    """paths of the tracked files that are changed in the working tree or the index"""
+    # git status --porcelain -z --untracked-files=no
+    entries = _git_output('status', '--porcelain', '-z', '--untracked-files=no').decode()
+    entries = entries.split('\0')
+    paths = []
+    while entries:
+        entry = entries.pop(0)
+        if not entry:
+            continue
+        paths.append(entry[3:])
+        # renames and copies are followed by the original path
+        if entry[0] in 'RC':
+            entries.pop(0)
+    return paths
+
+def _worktree_blobs(base_commit):
+    """blob of each file in the working tree that is different from the base commit.
+        Deleted files have an empty blob.
+
+    :return: dictionary of path to blob sha
+    """
+    # git diff --raw -z --no-abbrev --no-renames <base>
+    output = _git_output('diff', '--raw', '-z', '--no-abbrev', '--no-renames',
+                         base_commit).decode()
+    fields = output.split('\0')
+    blobs = {}
+    unhashed = []
+    for status, path in zip(fields[0::2], fields[1::2]):
+        if not status.startswith(':'):
+            continue
+        _, _, _, blob, change = status[1:].split(' ')
+        if change == 'D':
+            blobs[path] = ''
+        elif blob.strip('0'):
+            blobs[path] = blob
+        else:
+            # git leaves the blob of changed working tree files for us to hash
+            unhashed.append(path)
+    if unhashed:
+        # git hash-object -- <paths>
+        hashes = _git_output('hash-object', '--', *unhashed).decode().split()
+        blobs.update(zip(unhashed, hashes))
+    return blobs
+
+def _read_worktree_diff(base_commit, paths=None):
+    """diff between the base commit and the working tree, for the paths or all files"""
+    # git diff --no-prefix -U10000 <base> -- <paths>
+    args = ['diff', '--no-prefix', '-U10000', base_commit]
+    if paths:
+        args += ['--', *paths]
+    return PatchSet(io.BytesIO(_git_output(*args)), encoding='utf-8')
+
+async def _git_async(*args):
+    """run a git command without blocking the event loop
+
+    :return: return code, stdout and stderr output
+    """
+    process = await asyncio.create_subprocess_exec('git', *args, stdout=PIPE, stderr=PIPE)
+    stdoutput, stderroutput = await process.communicate()
+    return process.returncode, stdoutput, stderroutput
+
+async def _check_branch_fastforward_async(main_branch, project_branch):
+    # async version of _check_branch_fastforward
+    returncode, _, _ = await _git_async('merge-base', '--is-ancestor', main_branch,
+                                        project_branch)
+    if returncode:
+        log.warning("Branch %s can not be fast-forwarded to %s " +
+                "comparison may not be accurate until rebased.", main_branch, project_branch)
+        return False
+    return True
+
+async def _check_active_branch_async(project_branch):
+    # async version of _check_active_branch
+    _, stdoutput, stderroutput = await _git_async('symbolic-ref', '--short', '-q', 'HEAD')
+    if 'fatal' in stderroutput.decode():
+        # Handle error case
+        log.fatal("Error getting active branch %s", stderroutput)
+        sys.exit()
+    if project_branch not in stdoutput.decode():
+        log.fatal("Must check out the branch to check %s", project_branch)
+        log.fatal("Active branch is %s", stdoutput.decode())
+        sys.exit()
+
+async def _merge_base_async(main_branch, project_branch):
+    """newest common ancester of both branches, see _read_branch_diff"""
+    _, stdoutput, stderroutput = await _git_async('merge-base', project_branch, main_branch)
+    if 'fatal' in stderroutput.decode():
+        # Handle error case
+        log.fatal("Error process merge-base: %s", stderroutput)
+        sys.exit()
+    return stdoutput.decode().strip()
+
+def _parse_file_diff(lines):
+    """parse the diff lines for one file into a PatchedFile"""
+    for patched_file in PatchSet(io.BytesIO(b"".join(lines)), encoding='utf-8'):
+        yield patched_file
+
+def _split_diff(data):
+    """split the output of git diff into the path and the diff lines of each file.  Only the
+        file headers are parsed, the lines are parsed later with _parse_file_diff.
+
+    :return: list of (path, lines)
+    """
+    chunks = []
+    for line in data.splitlines(keepends=True):
+        if line.startswith(DIFF_FILE_START) or not chunks:
+            chunks.append([])
+        chunks[-1].append(line)
+    files = []
+    for lines in chunks:
+        header = []
+        for line in lines:
+            if line.startswith(b"@@"):
+                break
+            header.append(line)
+        for patched_file in _parse_file_diff(header):
+            files.append((patched_file.path, lines))
+    return files
+
+async def _stream_branch_diff(base_commit, project_branch, queue):
+    """stream the diff between the branches onto the queue one PatchedFile at a time, as git
+        writes it.  None is put on the queue when the diff is finished.
+    """
+    process = await asyncio.create_subprocess_exec(
+        'git', 'diff', '--no-prefix', '-U10000', base_commit, project_branch,
+        stdout=PIPE, stderr=PIPE, limit=DIFF_STREAM_LIMIT)
+    stderr_task = asyncio.ensure_future(process.stderr.read())
+
+    file_lines = []
+    async for line in process.stdout:
+        if line.startswith(DIFF_FILE_START) and file_lines:
+            for patched_file in _parse_file_diff(file_lines):
+                await queue.put(patched_file)
+            file_lines = []
+        file_lines.append(line)
+    if file_lines:
+        for patched_file in _parse_file_diff(file_lines):
+            await queue.put(patched_file)
+
+    stderroutput = await stderr_task
+    await process.wait()
+    await queue.put(None)
+    if 'fatal' in stderroutput.decode():
+        # Handle error case
+        log.fatal("Error process diff: %s", stderroutput)
+        sys.exit()
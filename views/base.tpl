@@ -1,22 +1,64 @@
-%setdefault('stylesheet', None)
-%setdefault('navigation', False)
-<!DOCTYPE html>
-<html>
-<head><title>{{title or 'Doorstop'}}</title>
-  <meta charset="utf-8" />
-  <meta http-equiv="content-type" content="text/html; charset=UTF-8" />
-  <link rel="stylesheet" href="{{baseurl}}assets/doorstop/bootstrap.min.css" />
-  <link rel="stylesheet" href="{{baseurl}}assets/doorstop/general.css" />
-  {{! '<link type="text/css" rel="stylesheet" href="%s" />'%(baseurl+'assets/doorstop/'+stylesheet) if stylesheet else "" }}
-  <script type="text/javascript" src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.5/MathJax.js?config=TeX-MML-AM_CHTML" ></script>
-  <script type="text/x-mathjax-config">
-  MathJax.Hub.Config({
-    tex2jax: {inlineMath: [["$","$"],["\\(","\\)"]]}
-  });
-  </script>
-</head>
-<body>
-{{! '<P>Navigation: <a href="{0}">Home</a> &bull; <a href="{0}documents/">Documents</a>'.format(baseurl) if navigation else ''}}
-  {{!base}}
-</body>
-</html>
+%setdefault('stylesheet', None)
+%setdefault('navigation', False)
+%setdefault('lazy_mathjax', False)
+%setdefault('css_bundle', None)
+<!DOCTYPE html>
+<html>
+<head><title>{{title or 'Doorstop'}}</title>
+  <meta charset="utf-8" />
+  <meta http-equiv="content-type" content="text/html; charset=UTF-8" />
+%if css_bundle:
+  <link rel="stylesheet" href="{{baseurl}}assets/{{css_bundle}}" />
+%else:
+  <link rel="stylesheet" href="{{baseurl}}assets/doorstop/bootstrap.min.css" />
+  <link rel="stylesheet" href="{{baseurl}}assets/doorstop/general.css" />
+  {{! '<link type="text/css" rel="stylesheet" href="%s" />'%(baseurl+'assets/doorstop/'+stylesheet) if stylesheet else "" }}
+%end
+  <script type="text/javascript" src="https://cdnjs.cloudflare.com/ajax/libs/mathjax/2.7.5/MathJax.js?config=TeX-MML-AM_CHTML" ></script>
+  <script type="text/x-mathjax-config">
+  MathJax.Hub.Config({
+%if lazy_mathjax:
+    skipStartupTypeset: true,
+%end
+    tex2jax: {inlineMath: [["$","$"],["\\(","\\)"]]}
+  });
+  </script>
+</head>
+<body>
+{{! '<P>Navigation: <a href="{0}">Home</a> &bull; <a href="{0}documents/">Documents</a>'.format(baseurl) if navigation else ''}}
+  {{!base}}
+%if lazy_mathjax:
+<script>
+  // only typeset the math in the parts of the page that are scrolled into view
+  MathJax.Hub.Register.StartupHook("End", function() {
+    var typeset = function(element) { MathJax.Hub.Queue(["Typeset", MathJax.Hub, element]); };
+    var main = document.getElementById("main") || document.body;
+    if (!("IntersectionObserver" in window)) {
+      typeset(main);
+      return;
+    }
+    var observer = new IntersectionObserver(function(entries) {
+      entries.forEach(function(entry) {
+        if (entry.isIntersecting) {
+          observer.unobserve(entry.target);
+          typeset(entry.target);
+        }
+      });
+    }, {rootMargin: "200px"});
+    // a document section is one list or table, so each item and row is watched on its own
+    var observe = function(element) {
+      for (var i = 0; i < element.children.length; i++) {
+        var child = element.children[i];
+        if (/^(UL|OL|TABLE|THEAD|TBODY)$/.test(child.tagName)) {
+          observe(child);
+        } else {
+          observer.observe(child);
+        }
+      }
+    };
+    observe(main);
+  });
+</script>
+%end
+</body>
+</html>
@@ -1,8 +1,8 @@
-% rebase('base.tpl', title='Doorstop')
-<H1>Doorstop - Index</H1>
-<P>
-<code>
-<pre>
-{{!tree_code}}
-</pre>
-</code>
+% rebase('base.tpl', title='Doorstop')
+<H1>Doorstop - Index</H1>
+<P>
+<code>
+<pre>
+{{!tree_code}}
+</pre>
+</code>
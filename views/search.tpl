@@ -0,0 +1,5 @@
+<form id="search" class="search" role="search" onsubmit="return false;">
+  <input id="search-input" type="search" class="form-control" placeholder="Search UID, header or text" autocomplete="off" />
+  <ol id="search-results" class="search-results"></ol>
+</form>
+<script src="{{baseurl}}assets/doorstop/search.js"></script>
@@ -0,0 +1,274 @@
+"""
+    Watch the project branch and publish again as it changes.
+    The project ref and the working tree are polled.  When they change, only the item files
+    whose blobs changed are processed again.  Items that were edited are reloaded in place and
+    only the sections of the output they show up in are generated again, adding or removing
+    an item rebuilds the tree.
+"""
+import os
+import sys
+import time
+
+from doorstop.common import DoorstopError
+
+from common import logger
+from vcs_common import (_check_active_branch, _merge_base, _rev_parse, _worktree_changes,
+                        _worktree_blobs, _read_worktree_diff)
+from process_diff import _temp_path, _prepare_temp_path, _process_patched_file, _build_tree
+from publish_project import _publish_single, _publish_split, _split_plan
+from publish_assets import sync_assets, css_bundle
+from publish_compress import compress_site
+from link_index import LinkIndex, LazyTree
+from search_index import SearchIndex
+from impact import LinkGraph, publish_impact, changed_uids
+from workspace import publish_site
+
+log = logger(__name__)
+
+# seconds between checks of the project branch
+DEFAULT_INTERVAL = 1.0
+
+
+def _status(message):
+    """tell the user at the terminal what the watcher is doing.  The log only has warnings
+        without a log file, so this goes to stderr as well as the log."""
+    log.info(message)
+    print(message, file=sys.stderr, flush=True)
+
+
+def _item_uid(path):
+    """UID of an item from its file path"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+class ProjectWatcher:
+    """Publishes the comparison of the working tree of the project branch against the main
+        branch, and keeps it up to date as the branch changes.
+
+    :param main_branch: main branch
+    :param project_branch: project branch, it has to be checked out
+    :param publish_options: keyword arguments for publish_project
+    :param temp_path: folder to process the diff and publish in, defaults to one named after
+                      the branch
+    :param output: where to put the site after each publish, None leaves it in temp_path
+    :param after_only: only publish the project side of the changed items
+    """
+    def __init__(self, main_branch, project_branch, publish_options=None, temp_path=None,
+                 output=None, after_only=False):
+        self.main_branch = main_branch
+        self.project_branch = project_branch
+        self.options = dict(publish_options or {})
+        self.after_only = after_only
+        self.temp_path = temp_path or _temp_path(project_branch)
+        self.output = output
+        self.publish_folder = None
+        self.fingerprint = None
+        self.base_commit = None
+        self.link_index = None
+        self.link_graph = None
+        # blob of each changed file, and the document path of each item written to temp_path
+        self.blobs = {}
+        self.written = {}
+        self.tree = None
+        # html of each document section from the last publish, and the items on each page
+        # when the output is split
+        self.sections = {}
+        self.pages = {}
+        self.search_index = SearchIndex() if self.options.get("search") else None
+        # the stylesheet bundle the pages link, when sync_assets wrote one
+        self.bundle = None
+
+    def _fingerprint(self):
+        """the state of the branches and the working tree, cheap to check"""
+        stats = []
+        for path in _worktree_changes():
+            try:
+                stat = os.stat(path)
+                stats.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                stats.append((path, None, None))
+        return (_rev_parse(self.main_branch), _rev_parse(self.project_branch), tuple(stats))
+
+    def poll(self):
+        """publish again if the project branch or the working tree changed
+
+        :return: number of changed files that were processed, None if nothing changed
+        """
+        fingerprint = self._fingerprint()
+        if fingerprint == self.fingerprint:
+            return None
+        moved = self.fingerprint is None or fingerprint[:2] != self.fingerprint[:2]
+        self.fingerprint = fingerprint
+
+        full = False
+        if moved:
+            base_commit = _merge_base(self.main_branch, self.project_branch)
+            full = base_commit != self.base_commit
+            self.base_commit = base_commit
+            if self.options.get("link_graph") is not None:
+                # the downstream items are found in the graph at the new project commit
+                self.link_graph = LinkGraph(self.project_branch,
+                                            self.options["link_graph"].cache_dir,
+                                            self.main_branch)
+            if self.options.get("link_index") is not None:
+                # links are resolved against the tree at the new project commit
+                cache_dir = self.options["link_index"].cache_dir
+                self.link_index = LinkIndex(self.project_branch, cache_dir,
+                                            self.link_graph or
+                                            LinkGraph(self.project_branch, cache_dir))
+                full = True
+
+        blobs = _worktree_blobs(self.base_commit)
+        if full:
+            self.blobs = blobs
+            self._rebuild()
+            self._publish_site()
+            return len(blobs)
+
+        changed = sorted(path for path in set(blobs) | set(self.blobs)
+                         if blobs.get(path) != self.blobs.get(path))
+        self.blobs = blobs
+        if changed:
+            self._update(changed)
+            self._publish_site()
+        return len(changed)
+
+    def run(self, interval=None):
+        """poll until interrupted"""
+        interval = interval or DEFAULT_INTERVAL
+        _check_active_branch(self.project_branch)
+        _status("Watching {} against {}, press Ctrl+C to stop".format(self.project_branch,
+                                                                      self.main_branch))
+        try:
+            while True:
+                start = time.perf_counter()
+                count = self.poll()
+                if count is not None:
+                    _status("Published {} changed files in {:.2f}s".format(
+                        count, time.perf_counter() - start))
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def _process(self, patched_file):
+        """process one changed file again, replacing the item written for it last time"""
+        temp_file = os.path.join(self.temp_path, patched_file.path)
+        if os.path.isfile(temp_file):
+            os.remove(temp_file)
+        if _process_patched_file(patched_file, self.temp_path, [], self.after_only):
+            self.written[patched_file.path] = os.path.dirname(patched_file.path)
+        else:
+            self.written.pop(patched_file.path, None)
+
+    def _rebuild(self):
+        """process the whole diff and publish everything"""
+        log.info("Rebuilding %s against %s", self.project_branch, self.base_commit)
+        self.publish_folder = _prepare_temp_path(self.temp_path)
+        self.written = {}
+        for patched_file in _read_worktree_diff(self.base_commit):
+            self._process(patched_file)
+        self.bundle = css_bundle(sync_assets(self.publish_folder,
+                                             store=self.options.get("asset_store")))
+        self._load_tree()
+        self._publish()
+
+    def _update(self, changed):
+        """process the changed files, and publish the sections they show up in"""
+        log.info("Updating %d changed files", len(changed))
+        items = set(self.written)
+        processed = set()
+        for patched_file in _read_worktree_diff(self.base_commit, changed):
+            processed.add(patched_file.path)
+            self._process(patched_file)
+        # files that are back to the way they are on the main branch
+        for path in changed:
+            if path not in processed:
+                temp_file = os.path.join(self.temp_path, path)
+                if os.path.isfile(temp_file):
+                    os.remove(temp_file)
+                self.written.pop(path, None)
+
+        if set(self.written) != items:
+            self._load_tree()
+            self._publish()
+            return
+
+        dirty = set()
+        for path in changed:
+            if path not in self.written:
+                continue
+            item = self.tree.find_item(_item_uid(path))
+            dirty.update(self._related(item))
+            item.load(reload=True)
+            dirty.update(self._related(item))
+        self._publish(dirty)
+
+    def _publish_site(self):
+        """compress the pages that changed, and copy them to a new release at the output.
+            The rest of the files are hardlinked from the current release, and the workspace
+            keeps its copy to update next time."""
+        compress_site(self.publish_folder)
+        if self.output is not None:
+            publish_site(self.publish_folder, self.output, copy=True)
+
+    def _load_tree(self):
+        """build the tree for the items in the temp path"""
+        doc_list = []
+        for path in sorted(self.written):
+            if self.written[path] not in doc_list:
+                doc_list.append(self.written[path])
+        self.tree = _build_tree(self.temp_path, doc_list) if doc_list else None
+        self.sections = {}
+
+    @staticmethod
+    def _related(item):
+        """UIDs of the item and the items that show its links, or that it shows links for"""
+        related = {str(item.uid)}
+        related.update(str(uid) for uid in item.links)
+        related.update(str(child.uid) for child in item.find_child_items())
+        return related
+
+    def _publish(self, dirty=None):
+        """publish the sections with the dirty item UIDs on them, or everything
+
+        :param dirty: UIDs of the items that have to be published again, None for all
+        """
+        if self.tree is None:
+            log.warning("No normative changes to publish")
+            return
+        links_tree = LazyTree(self.tree, self.link_index) if self.link_index else None
+        appendix = ""
+        if self.link_graph is not None:
+            appendix = publish_impact(self.link_graph, changed_uids(self.tree),
+                                      self.publish_folder)
+
+        if not self.options.get("split"):
+            prefixes = None
+            if dirty is not None:
+                prefixes = set()
+                for uid in dirty:
+                    try:
+                        prefixes.add(self.tree.find_item(uid).document.prefix)
+                    except DoorstopError:
+                        continue
+            _publish_single(self.tree, self.publish_folder, links_tree, self.sections, prefixes,
+                            self.search_index, appendix, self.bundle)
+            return
+
+        items_per_page = self.options.get("items_per_page")
+        _, section_pages = _split_plan(self.tree, self.publish_folder, items_per_page,
+                                       links_tree)
+        pages = {name: [str(item.uid) for item in document_pages[page]]
+                 for _, page, document_pages, name in section_pages}
+        only_pages = None
+        if dirty is not None:
+            only_pages = {name for name, uids in pages.items()
+                          if uids != self.pages.get(name) or dirty.intersection(uids)}
+        _publish_split(self.tree, self.publish_folder, items_per_page, links_tree, only_pages,
+                       self.search_index, appendix, self.bundle)
+        # pages left over from a document that got shorter
+        for name in set(self.pages) - set(pages):
+            page_path = os.path.join(self.publish_folder, name)
+            if os.path.isfile(page_path):
+                os.remove(page_path)
+        self.pages = pages
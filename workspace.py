@@ -0,0 +1,235 @@
+"""
+    Per-run workspaces.
+    Each run processes the diff and publishes into a folder of its own, so runs for the same
+    branch, or in the same folder, don't delete each other's files.  The finished site is then
+    swapped into place in one step, readers see the last site or the new one and never a site
+    that is half written.
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+
+from common import logger
+from publish_assets import ASSETS, ASSET_MANIFEST
+from publish_compress import CONTENT_MANIFEST
+
+try:
+    import fcntl
+except ImportError:
+    # windows locks a byte of the lock file instead
+    fcntl = None
+    import msvcrt
+
+log = logger(__name__)
+
+DEFAULT_TMPFS = "/dev/shm"
+# published sites are readable by a web server even though the workspace is private
+SITE_MODE = 0o755
+# written into every release folder, only folders with it are ever removed.  It only holds the
+# name of the site, the release is served
+RELEASE_MARKER = ".release"
+# seconds between tries for the publish lock on windows
+LOCK_INTERVAL = 0.1
+
+
+def workspace_root(root=None, tmpfs=False):
+    """folder to create the run workspaces in
+
+    :param root: folder for the workspaces, defaults to the system temp folder
+    :param tmpfs: put the workspaces in memory when there is a tmpfs
+    """
+    if tmpfs:
+        if os.path.isdir(DEFAULT_TMPFS):
+            return DEFAULT_TMPFS
+        log.warning("There is no tmpfs at %s, using %s", DEFAULT_TMPFS,
+                    root or tempfile.gettempdir())
+    return root or tempfile.gettempdir()
+
+
+@contextlib.contextmanager
+def run_workspace(name, root=None, tmpfs=False, keep=False):
+    """a new workspace folder for one run, removed when the run is done
+
+    :param name: start of the folder name, the temp path for the project branch
+    :param root: folder for the workspaces, defaults to the system temp folder
+    :param tmpfs: put the workspace in memory when there is a tmpfs
+    :param keep: leave the workspace in place to look at the processed items
+    """
+    root = workspace_root(root, tmpfs)
+    os.makedirs(root, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=name + "-", dir=root)
+    log.info("Workspace for this run is %s", path)
+    try:
+        yield path
+    finally:
+        if keep:
+            log.info("Keeping the workspace %s", path)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _link_asset(src, dest):
+    """hardlink an asset, the manifest is copied since sync_assets writes it in place"""
+    if os.path.basename(src) != ASSET_MANIFEST:
+        try:
+            os.link(src, dest)
+            return dest
+        except OSError:
+            pass
+    return shutil.copy2(src, dest)
+
+
+def seed_assets(site, publish_folder):
+    """start the assets of a new site from the last published one, so sync_assets only has
+        to write the assets that changed.  sync_assets never writes through an asset file, so
+        they are hardlinked when the folders are on the same file system.
+
+    :param site: the published site
+    :param publish_folder: the publish folder in the workspace
+    """
+    assets = os.path.join(site, ASSETS)
+    if not os.path.isdir(assets):
+        return
+    shutil.copytree(assets, os.path.join(publish_folder, ASSETS), copy_function=_link_asset,
+                    dirs_exist_ok=True)
+    # the content hashes let compress_site keep the compressed copies of the assets
+    content_manifest = os.path.join(site, CONTENT_MANIFEST)
+    if os.path.isfile(content_manifest):
+        shutil.copy2(content_manifest, os.path.join(publish_folder, CONTENT_MANIFEST))
+
+
+def _release_prefix(name):
+    """start of the names of the release folders for a site"""
+    return ".{}-".format(name)
+
+
+def _is_release(path, output):
+    """if a folder is a release publish_site made for output"""
+    parent, name = os.path.split(output)
+    return (os.path.dirname(path) == parent and
+            os.path.basename(path).startswith(_release_prefix(name)) and
+            os.path.isfile(os.path.join(path, RELEASE_MARKER)))
+
+
+def _current_release(output):
+    """the release folder of the site at output, None when it wasn't published here"""
+    path = os.path.realpath(output)
+    if os.path.isfile(os.path.join(path, RELEASE_MARKER)):
+        return path
+    return None
+
+
+def _link_unchanged(source, current):
+    """copy function for copytree that hardlinks the files that look the same in the current
+        release, by size and mtime like compress_site.  Release files are never written again,
+        so they can be shared, and only the pages that changed are copied.
+
+    :param source: folder the site is copied from
+    :param current: the current release folder, None to copy everything
+    """
+    def copy(src, dest):
+        if current is not None:
+            old = os.path.join(current, os.path.relpath(src, source))
+            try:
+                new_stat = os.stat(src)
+                old_stat = os.stat(old)
+                if (new_stat.st_size == old_stat.st_size and
+                        new_stat.st_mtime_ns == old_stat.st_mtime_ns):
+                    os.link(old, dest)
+                    return dest
+            except OSError:
+                pass
+        return shutil.copy2(src, dest)
+    return copy
+
+
+@contextlib.contextmanager
+def _publish_lock(output):
+    """hold the lock file beside output, so only one site is swapped in at a time"""
+    parent, name = os.path.split(output)
+    with open(os.path.join(parent, ".{}.lock".format(name)), "a+b") as stream:
+        if fcntl is not None:
+            fcntl.flock(stream.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    stream.seek(0)
+                    msvcrt.locking(stream.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(LOCK_INTERVAL)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(stream.fileno(), fcntl.LOCK_UN)
+            else:
+                stream.seek(0)
+                msvcrt.locking(stream.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def publish_site(source, output, copy=False):
+    """put a finished site in place at output in one step.
+        The site goes into a new release folder beside output, and output is a symlink to it
+        that is swapped with os.replace.  Without symlinks the folders are swapped by renames.
+        A folder at output that wasn't published here is moved aside and kept.
+
+    :param source: folder the site was published to
+    :param output: where the site is read from
+    :param copy: copy the site rather than moving it, for a workspace that keeps publishing.
+                 Files that didn't change since the current release are hardlinked from it.
+
+    :return: the release folder
+    """
+    output = os.path.abspath(output)
+    parent, name = os.path.split(output)
+    os.makedirs(parent, exist_ok=True)
+
+    with _publish_lock(output):
+        release = tempfile.mkdtemp(prefix=_release_prefix(name), dir=parent)
+        if copy:
+            shutil.copytree(source, release, dirs_exist_ok=True,
+                            copy_function=_link_unchanged(source, _current_release(output)))
+        else:
+            os.rmdir(release)
+            try:
+                os.rename(source, release)
+            except OSError:
+                # the workspace is on another file system, like a tmpfs
+                shutil.copytree(source, release)
+        with open(os.path.join(release, RELEASE_MARKER), "w", encoding="utf-8") as stream:
+            stream.write(name + "\n")
+        os.chmod(release, SITE_MODE)
+
+        previous = None
+        if os.path.islink(output):
+            previous = os.path.realpath(output)
+        elif os.path.isdir(output):
+            # a site from before releases were used, or a release swapped in by renames
+            previous = tempfile.mkdtemp(prefix=_release_prefix(name), dir=parent)
+            os.rmdir(previous)
+            os.rename(output, previous)
+            if not os.path.isfile(os.path.join(previous, RELEASE_MARKER)):
+                log.warning("%s wasn't published here, it was moved to %s", output, previous)
+
+        link = release + ".link"
+        try:
+            os.symlink(os.path.basename(release), link, target_is_directory=True)
+            os.replace(link, output)
+        except (OSError, NotImplementedError) as err:
+            log.debug("Could not swap a symlink to %s (%s), renaming instead", release, err)
+            if os.path.islink(output):
+                os.remove(output)
+            elif os.path.lexists(output):
+                aside = release + ".old"
+                os.rename(output, aside)
+                log.warning("%s wasn't published here, it was moved to %s", output, aside)
+            os.rename(release, output)
+        log.info("Published %s", output)
+
+        # only remove folders this made, output may have been a symlink to anything
+        if previous and _is_release(previous, output):
+            shutil.rmtree(previous, ignore_errors=True)
+    return release